@@ -0,0 +1,56 @@
+# Async variants of the TMDB-heavy routes - all TMDB calls in a request are awaited together
+# Turned on with TMDB_ASYNC=1 (needs httpx and Flask[async]); the factory swaps them in for the sync views,
+# which hold the logic they share
+from flask import request, redirect
+from flask_login import login_required
+from app.tmdb_async import get_client
+from app.watched import current_watched_ids
+from app.search_index import CLOSE_SIMILARITY, merge_results, search_local
+from app.views import (POPULAR_PAGES, _unwatched, _render_movies, _begin_refresh, _refresh_pages, _keep_new,
+                       _finish_refresh, _render_details, _render_search, search)
+
+@login_required
+async def movies_async():
+    watched_movie_ids = current_watched_ids()
+    client = get_client()
+    all_movies, _ = await client.fetch_pages(client.get_popular_movies, POPULAR_PAGES, limit=20,
+                                             keep=_unwatched(watched_movie_ids))
+    return _render_movies(all_movies, watched_movie_ids)
+
+async def refresh_async():
+    begun = _begin_refresh()
+    if begun is None:
+        return redirect("/")
+    state, watched_movie_ids, seen_ids, new_movies = begun
+    last_page = state.current_page
+    
+    if not new_movies:
+        client = get_client()
+        new_movies, last_page = await client.fetch_pages(
+            lambda page: client.get_movies_with_filters(**state.preferences, page=page),
+            _refresh_pages(state), limit=8, keep=_keep_new(seen_ids))
+    
+    return _finish_refresh(state, new_movies, last_page, watched_movie_ids)
+
+async def movie_details_async(movie_id):
+    return _render_details(movie_id, await get_client().get_movie_details(movie_id))
+
+async def search_async():
+    if request.method == "POST":
+        return search()
+    
+    query = request.args.get("q", "")
+    movies_data = []
+    if query:
+        movies_data = search_local(query, min_similarity=CLOSE_SIMILARITY)
+        if not movies_data:
+            movies_data = merge_results(await get_client().search_movies(query), search_local(query))
+    return _render_search(query, movies_data)
+
+# Endpoint -> async view
+ASYNC_VIEWS = {
+    'views.movies': movies_async,
+    'views.refresh': refresh_async,
+    'views.movie_details': movie_details_async,
+    'views.search': search_async
+}
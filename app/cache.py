@@ -0,0 +1,486 @@
+# Response cache used for TMDB lookups
+# Local tier: in-process LRU with size and TTL limits
+# Shared tier (optional): SQLite file or Redis so every worker sees the same entries
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# Random owner token for a lock, so only whoever took it can release it
+def _lock_token():
+    return secrets.token_hex(16)
+
+# In-process LRU cache - entries expire after their TTL and the oldest are evicted when full
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # Like get, but leaves the stats and the LRU order alone (for polling) - with the seconds the entry has left
+    def peek_entry(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        now = time.monotonic()
+        if entry is None or entry[1] < now:
+            return None, 0
+        return entry[0], entry[1] - now
+
+    def peek(self, key):
+        return self.peek_entry(key)[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+# Shared tier stored in a local SQLite file - works across gunicorn workers on one host
+class SQLiteCache:
+    def __init__(self, path, max_entries=50000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, owner TEXT)")
+        # Lock tables from before owner tokens
+        if 'owner' not in [column[1] for column in conn.execute("PRAGMA table_info(locks)")]:
+            conn.execute("ALTER TABLE locks ADD COLUMN owner TEXT")
+        conn.commit()
+
+    # One connection per thread - sqlite3 connections can't be shared between threads
+    # (or with forked workers, so a connection opened before a preload fork is left alone in the children)
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # (value, seconds until it expires), or (None, 0) - the local tier copies an entry for no longer than that
+    def peek_entry(self, key):
+        try:
+            row = self._conn().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            row = None
+        now = time.time()
+        if row is None or row[1] < now:
+            return None, 0
+        return json.loads(row[0]), row[1] - now
+
+    def get_entry(self, key):
+        value, remaining = self.peek_entry(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, remaining
+
+    def peek(self, key):
+        return self.peek_entry(key)[0]
+
+    def get(self, key):
+        return self.get_entry(key)[0]
+
+    def set(self, key, value, ttl):
+        try:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(value), time.time() + ttl))
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._prune(conn)
+        except sqlite3.Error:
+            pass
+
+    # Drop expired rows, then the entries closest to expiry if still over the limit
+    def _prune(self, conn):
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            removed = count - self.max_entries
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)", (removed,))
+            self.evictions += removed
+
+    def delete(self, key):
+        try:
+            self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+    # Cross-process lock - the owner token if this caller now holds it, else None (expired locks are taken over)
+    def acquire_lock(self, key, ttl):
+        now = time.time()
+        token = _lock_token()
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at < ?", (key, now))
+            inserted = conn.execute("INSERT OR IGNORE INTO locks (key, expires_at, owner) VALUES (?, ?, ?)",
+                                    (key, now + ttl, token)).rowcount == 1
+            return token if inserted else None
+        except sqlite3.Error:
+            return token
+
+    # Only the owner's release counts - a lock that expired and was taken over stays with its new holder
+    def release_lock(self, key, token):
+        try:
+            self._conn().execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, token))
+        except sqlite3.Error:
+            pass
+
+    # Push a held lock's expiry out by ttl - False if it has been taken over (or released)
+    def extend_lock(self, key, token, ttl):
+        try:
+            return self._conn().execute("UPDATE locks SET expires_at = ? WHERE key = ? AND owner = ?",
+                                        (time.time() + ttl, key, token)).rowcount == 1
+        except sqlite3.Error:
+            return True
+
+    def stats(self):
+        return {"backend": "sqlite", "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# Shared tier stored in Redis - needs the optional redis package
+class RedisCache:
+    # Delete the lock only if it still holds our token
+    RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+    EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+    def __init__(self, url, prefix="tmdb:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._errors = redis.RedisError
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+        self._extend = self.client.register_script(self.EXTEND_SCRIPT)
+
+    # (value, seconds until it expires), or (None, 0) - value and PTTL in one round trip
+    def peek_entry(self, key):
+        try:
+            raw, pttl = self.client.pipeline().get(self.prefix + key).pttl(self.prefix + key).execute()
+        except self._errors:
+            return None, 0
+        if raw is None:
+            return None, 0
+        # -1: no expiry set
+        return json.loads(raw), pttl / 1000 if pttl >= 0 else float('inf')
+
+    def get_entry(self, key):
+        value, remaining = self.peek_entry(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, remaining
+
+    def peek(self, key):
+        return self.peek_entry(key)[0]
+
+    def get(self, key):
+        return self.get_entry(key)[0]
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+        except self._errors:
+            pass
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except self._errors:
+            pass
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def acquire_lock(self, key, ttl):
+        token = _lock_token()
+        try:
+            if self.client.set(self.prefix + "lock:" + key, token, nx=True, ex=max(1, int(ttl))):
+                return token
+            return None
+        except self._errors:
+            return token
+
+    def release_lock(self, key, token):
+        try:
+            self._release(keys=[self.prefix + "lock:" + key], args=[token])
+        except self._errors:
+            pass
+
+    def extend_lock(self, key, token, ttl):
+        try:
+            return bool(self._extend(keys=[self.prefix + "lock:" + key], args=[token, max(1, int(ttl))]))
+        except self._errors:
+            return True
+
+    # Redis handles eviction itself (maxmemory-policy)
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+# Local LRU in front of an optional shared backend
+class TieredCache:
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    # Copy a shared-tier hit into the local tier, expiring no later than the shared entry does
+    def _promote(self, key, value, remaining):
+        if value is not None:
+            self.local.set(key, value, min(remaining, self.local.ttl))
+        return value
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None or self.shared is None:
+            return value
+        return self._promote(key, *self.shared.get_entry(key))
+
+    # Seconds until key expires where every worker reads it (0 if it isn't cached)
+    def ttl_left(self, key):
+        tier = self.shared if self.shared is not None else self.local
+        return tier.peek_entry(key)[1]
+
+    # Read without counting a hit or miss in either tier
+    def peek(self, key):
+        value = self.local.peek(key)
+        if value is not None or self.shared is None:
+            return value
+        return self._promote(key, *self.shared.peek_entry(key))
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.local.ttl
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    # Locks only matter between workers, so without a shared tier the caller always gets it
+    def acquire_lock(self, key, ttl):
+        if self.shared is None:
+            return _lock_token()
+        return self.shared.acquire_lock(key, ttl)
+
+    def release_lock(self, key, token):
+        if self.shared is not None:
+            self.shared.release_lock(key, token)
+
+    def extend_lock(self, key, token, ttl):
+        if self.shared is None:
+            return True
+        return self.shared.extend_lock(key, token, ttl)
+
+    def stats(self):
+        stats = {"local": self.local.stats()}
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+
+# Decayed read counts per cache key, with what is needed to fetch it again and when it was last stored
+# Used for refresh-ahead: hot keys are refetched before their TTL runs out (see app/refresher.py)
+class HotKeys:
+    def __init__(self, half_life=300, max_keys=5000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = {}  # key -> [score, last_read, stored_at, ttl, refetch]
+
+    def _score(self, entry, now):
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    # Count a read of key - refetch is whatever the refresher needs to fetch it again
+    def touch(self, key, refetch):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                if len(self._keys) >= self.max_keys:
+                    self._prune(now)
+                self._keys[key] = [1.0, now, None, None, refetch]
+            else:
+                entry[0] = self._score(entry, now) + 1
+                entry[1] = now
+
+    # key was fetched age seconds ago (by this or another worker) and stays cached for ttl seconds from then
+    def stored(self, key, ttl, age=0):
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None:
+                entry[2] = time.monotonic() - age
+                entry[3] = ttl
+
+    # (key, refetch) for keys scoring at least min_score that are past `ahead` of their TTL, hottest first
+    # Keys this process never stored (e.g. read from the shared tier) have an unknown age and are always due
+    def due(self, ahead, min_score):
+        now = time.monotonic()
+        with self._lock:
+            due = [(self._score(entry, now), key, entry[4]) for key, entry in self._keys.items()
+                   if entry[2] is None or now >= entry[2] + entry[3] * ahead]
+        due = [item for item in due if item[0] >= min_score]
+        due.sort(key=lambda item: -item[0])
+        return [(key, refetch) for _, key, refetch in due]
+
+    # Forget the coldest tenth of the keys
+    def _prune(self, now):
+        coldest = sorted(self._keys, key=lambda key: self._score(self._keys[key], now))
+        for key in coldest[:max(1, len(coldest) // 10)]:
+            del self._keys[key]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# Lets concurrent callers asking for the same key share one call and its result
+# Threads and event loops wait on the same call, so sync and async fetches of a key share one request
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    # (future for the key's call, whether the caller has to make it)
+    def _join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = Future()
+                return call, True
+            self.shared += 1
+            return call, False
+
+    # Waiters get None if the call raised - only the caller that made it sees the error
+    def _finish(self, key, call, result):
+        with self._lock:
+            del self._calls[key]
+        call.set_result(result)
+
+    def do(self, key, fn):
+        call, leader = self._join(key)
+        if not leader:
+            return call.result()
+        result = None
+        try:
+            result = fn()
+        finally:
+            self._finish(key, call, result)
+        return result
+
+    # Same for a coroutine function, awaited in the caller's loop
+    async def do_async(self, key, fn):
+        call, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(call)
+        result = None
+        try:
+            result = await fn()
+        finally:
+            self._finish(key, call, result)
+        return result
+
+
+# Pick the shared backend from a URL: redis://... or sqlite:///path/to/file.db
+def make_shared_backend(url):
+    if not url:
+        return None
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisCache(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported cache URL: {url}")
+
+
+# Build the TMDB cache from environment variables
+def cache_from_env():
+    local = LRUCache(maxsize=int(os.getenv('TMDB_CACHE_SIZE', 2048)),
+                     ttl=int(os.getenv('TMDB_CACHE_TTL', 3600)))
+    return TieredCache(local, make_shared_backend(os.getenv('TMDB_CACHE_URL')))
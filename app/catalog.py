@@ -0,0 +1,218 @@
+# Local movie catalog - keeps TMDB metadata in our own database
+# Run the sync job with: python -m app.catalog [--pages 50] [--incremental]
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, CatalogMovie, CatalogSync, bulk_upsert
+# Before tmdb_api - importing the factory loads .env, and tmdb_api reads its settings at import
+from app.factory import create_app
+from app.tmdb_api import get_movie_list, discover_movies, get_movie, fetch_pages
+from app.rate_limit import BACKGROUND, priority, with_priority
+from app.records import Movie
+
+# Columns refreshed from list endpoints (popular/discover) and from the details endpoint
+LIST_COLUMNS = ['title', 'overview', 'genre_ids', 'release_date', 'release_year',
+                'vote_average', 'vote_count', 'popularity', 'poster_path', 'synced_at']
+DETAIL_COLUMNS = LIST_COLUMNS + ['runtime', 'details_synced_at']
+
+# Catalog ordering for each TMDB sort_by the quiz can ask for
+SORT_COLUMNS = {
+    'popularity.desc': CatalogMovie.popularity.desc(),
+    'vote_average.desc': CatalogMovie.vote_average.desc(),
+    'vote_count.asc': CatalogMovie.vote_count.asc()
+}
+
+# Rows per catalog page - the local source only answers with a full one
+PAGE_SIZE = 20
+
+# How often a process looks for a finished sync while it hasn't seen one
+SYNC_CHECK_SECONDS = 60
+
+_synced = False
+_synced_checked_at = float('-inf')
+
+# Lists the bulk sync pages through (raw TMDB results, not the trimmed cached records)
+SYNC_LISTS = [
+    lambda page: get_movie_list("/movie/popular", page),
+    lambda page: discover_movies(page, "popularity.desc"),
+    lambda page: discover_movies(page, "vote_count.desc")
+]
+
+# Turn a TMDB movie (list result or details) into a catalog row
+def movie_row(movie, now):
+    genre_ids = movie.get('genre_ids')
+    if genre_ids is None:
+        genre_ids = [genre['id'] for genre in movie.get('genres', [])]
+    release_date = movie.get('release_date') or None
+
+    row = {
+        'id': movie['id'],
+        'title': movie.get('title') or '',
+        'overview': movie.get('overview'),
+        'genre_ids': f",{','.join(map(str, genre_ids))}," if genre_ids else '',
+        'release_date': release_date,
+        'release_year': int(release_date[:4]) if release_date else None,
+        'vote_average': movie.get('vote_average') or 0,
+        'vote_count': movie.get('vote_count') or 0,
+        'popularity': movie.get('popularity') or 0,
+        'poster_path': movie.get('poster_path'),
+        'synced_at': now
+    }
+    if 'runtime' in movie:
+        row['runtime'] = movie['runtime'] or None
+        row['details_synced_at'] = now
+    return row
+
+# Catalog row back into the same record the TMDB list fetchers return
+def to_movie(row):
+    return Movie(row.id, row.title, row.overview or '', row.poster_path, row.release_date or '',
+                 row.vote_average, row.vote_count, row.popularity,
+                 tuple(int(genre_id) for genre_id in row.genre_ids.strip(',').split(',') if genre_id))
+
+# Upsert TMDB movies in one statement (duplicates in the batch are merged first)
+def _upsert(movies, now, columns):
+    rows = {}
+    for movie in movies:
+        rows[movie['id']] = movie_row(movie, now)
+    bulk_upsert(CatalogMovie, list(rows.values()), ['id'], columns)
+    db.session.commit()
+    return len(rows)
+
+# Page through popular and discover lists and upsert every movie found
+def sync_lists(pages=50, batch_pages=10):
+    now = datetime.utcnow()
+    synced = 0
+    for fetch in SYNC_LISTS:
+        for start in range(1, pages + 1, batch_pages):
+            # The sync wants every page, so a whole batch is kept in flight
+            movies, _ = fetch_pages(fetch, range(start, min(start + batch_pages, pages + 1)), ahead=batch_pages)
+            if not movies:
+                break
+            synced += _upsert(movies, now, LIST_COLUMNS)
+    return synced
+
+# Refresh rows that have never had details fetched or whose details are older than stale_days
+def refresh_stale(stale_days=7, limit=1000, batch_size=200, workers=8):
+    cutoff = datetime.utcnow() - timedelta(days=stale_days)
+    movie_ids = [movie_id for (movie_id,) in db.session.query(CatalogMovie.id)
+                 .filter(db.or_(CatalogMovie.details_synced_at.is_(None), CatalogMovie.details_synced_at < cutoff))
+                 .order_by(CatalogMovie.popularity.desc())
+                 .limit(limit)]
+
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(movie_ids), batch_size):
+            batch = movie_ids[start:start + batch_size]
+            movies = [movie for movie in executor.map(with_priority(BACKGROUND, get_movie), batch) if movie]
+            refreshed += _upsert(movies, datetime.utcnow(), DETAIL_COLUMNS)
+    return refreshed
+
+# Bulk sync (lists + stale details), or only the stale rows when incremental is set
+def sync_catalog(pages=50, incremental=False, stale_days=7, details_limit=1000):
+    # Sync traffic only uses rate-limit headroom left over by page loads
+    with priority(BACKGROUND):
+        listed = 0 if incremental else sync_lists(pages)
+        refreshed = refresh_stale(stale_days, details_limit)
+    # Imported here so web workers that only read the catalog don't load numpy at startup
+    from app.recommender import reset_engine
+    from app.search_index import reset_index
+    reset_engine()
+    reset_index()
+
+    db.session.add(CatalogSync(listed=listed, refreshed=refreshed))
+    db.session.commit()
+    return {'listed': listed, 'refreshed': refreshed}
+
+# Same filters as tmdb_api.get_movies_with_filters, answered from the catalog
+# [] when a runtime filter is set but some matching rows have no details yet (runtime unknown), since
+# those rows would be dropped and TMDB can answer properly
+def query_catalog(genres=None, min_year=None, max_year=None,
+                  min_runtime=None, max_runtime=None,
+                  min_rating=None, sort_by="popularity.desc", page=1, per_page=PAGE_SIZE):
+    order = SORT_COLUMNS.get(sort_by)
+    if order is None:
+        return []
+
+    query = CatalogMovie.query
+    for genre_id in genres or []:
+        query = query.filter(CatalogMovie.genre_ids.like(f'%,{int(genre_id)},%'))
+    if min_year:
+        query = query.filter(CatalogMovie.release_year >= min_year)
+    if max_year:
+        query = query.filter(CatalogMovie.release_year <= max_year)
+    if min_rating:
+        query = query.filter(CatalogMovie.vote_average >= min_rating)
+
+    if min_runtime or max_runtime:
+        if query.filter(CatalogMovie.details_synced_at.is_(None)).with_entities(CatalogMovie.id).first():
+            return []
+    if min_runtime:
+        query = query.filter(CatalogMovie.runtime >= min_runtime)
+    if max_runtime:
+        query = query.filter(CatalogMovie.runtime <= max_runtime)
+
+    rows = query.order_by(order, CatalogMovie.id).offset((page - 1) * per_page).limit(per_page).all()
+    return [to_movie(row) for row in rows]
+
+def _safe_query(filters):
+    try:
+        return query_catalog(**filters)
+    except SQLAlchemyError:
+        # Missing table or DB hiccup - let TMDB answer instead
+        db.session.rollback()
+        return []
+
+# Whether a catalog sync has ever finished - once it has, that is remembered for the life of the process
+def _catalog_synced():
+    global _synced, _synced_checked_at
+    if not _synced and time.monotonic() - _synced_checked_at > SYNC_CHECK_SECONDS:
+        _synced_checked_at = time.monotonic()
+        try:
+            _synced = db.session.query(CatalogSync.id).first() is not None
+        except SQLAlchemyError:
+            db.session.rollback()
+    return _synced
+
+# Whether the catalog may answer for the app in this context - the CATALOG_ENABLED rule the factory applies
+# to the discover source, for the other readers of the catalog (the recommender)
+def catalog_enabled():
+    mode = current_app.config.get('CATALOG_ENABLED', 'auto')
+    if mode == '0':
+        return False
+    return mode != 'auto' or _catalog_synced()
+
+# A full page, or [] so TMDB answers - a sparse or partly synced catalog would otherwise
+# return fewer and worse movies than discover
+def _local_page(filters, require_sync):
+    if require_sync and not _catalog_synced():
+        return []
+    movies = _safe_query(filters)
+    return movies if len(movies) >= PAGE_SIZE else []
+
+# Local source for tmdb_api.set_local_source - works inside and outside a request
+# With require_sync it stays off until the first python -m app.catalog run has finished
+def catalog_source(app, require_sync=True):
+    def source(**filters):
+        if has_app_context():
+            return _local_page(filters, require_sync)
+        with app.app_context():
+            return _local_page(filters, require_sync)
+    return source
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the local movie catalog from TMDB")
+    parser.add_argument("--pages", type=int, default=50, help="pages to read from each list")
+    parser.add_argument("--incremental", action="store_true", help="only refresh stale rows")
+    parser.add_argument("--stale-days", type=int, default=7)
+    parser.add_argument("--details-limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        result = sync_catalog(args.pages, args.incremental, args.stale_days, args.details_limit)
+    print(f"Synced {result['listed']} listed movies, refreshed details for {result['refreshed']}")
@@ -0,0 +1,134 @@
+# Collaborative filtering from the Watched table
+# An offline job builds item-item cosine similarity from co-watches and stores the top neighbours per movie
+# Run with: python -m app.collab [--neighbors 50] [--min-watchers 3]
+import argparse
+from array import array
+import numpy as np
+from sqlalchemy import insert
+from models import db, Watched, MovieNeighbor, CatalogMovie
+
+# Number of recent watches "because you watched" looks at
+RECENT_WATCHES = 20
+
+# Rows fetched from the database cursor at a time
+FETCH_SIZE = 100000
+
+
+# Stream (user_id, movie_id) pairs into compact arrays without building ORM objects
+def load_interactions(fetch_size=FETCH_SIZE):
+    users = array('q')
+    movies = array('q')
+    stmt = db.select(Watched.user_id, Watched.movie_id).execution_options(yield_per=fetch_size)
+    for partition in db.session.execute(stmt).partitions():
+        for user_id, movie_id in partition:
+            users.append(user_id)
+            movies.append(movie_id)
+    return np.asarray(users, dtype=np.int64), np.asarray(movies, dtype=np.int64)
+
+# Top-n most similar movies for every movie, as (movie_id, neighbor_id, score) tuples
+# Similarity is cosine over the binary user x movie matrix, computed one block of movies at a time
+def compute_neighbors(users, movies, n_neighbors=50, min_watchers=3, block_size=2000):
+    import scipy.sparse as sp
+
+    if len(users) == 0:
+        return
+    _, user_index = np.unique(users, return_inverse=True)
+    movie_ids, movie_index = np.unique(movies, return_inverse=True)
+    matrix = sp.csr_matrix((np.ones(len(users), dtype=np.float32), (user_index, movie_index)),
+                           shape=(user_index.max() + 1, len(movie_ids)))
+    matrix.data[:] = 1
+
+    # Movies with too few watchers give noisy similarities
+    watchers = np.asarray(matrix.sum(axis=0)).ravel()
+    keep = watchers >= min_watchers
+    norms = np.sqrt(watchers)
+    norms[~keep] = np.inf
+
+    by_movie = matrix.tocsc()
+    for start in range(0, len(movie_ids), block_size):
+        stop = min(start + block_size, len(movie_ids))
+        # Co-watch counts between this block of movies and every movie
+        co_watches = (by_movie[:, start:stop].T @ matrix).tocsr()
+        for row in range(stop - start):
+            movie = start + row
+            if not keep[movie]:
+                continue
+            begin, end = co_watches.indptr[row], co_watches.indptr[row + 1]
+            neighbors = co_watches.indices[begin:end]
+            scores = co_watches.data[begin:end] / (norms[movie] * norms[neighbors])
+            valid = (neighbors != movie) & (scores > 0)
+            neighbors, scores = neighbors[valid], scores[valid]
+            if len(neighbors) > n_neighbors:
+                top = np.argpartition(-scores, n_neighbors - 1)[:n_neighbors]
+                neighbors, scores = neighbors[top], scores[top]
+            for neighbor, score in zip(neighbors, scores):
+                yield int(movie_ids[movie]), int(movie_ids[neighbor]), float(score)
+
+# Rebuild the MovieNeighbor table from scratch in one transaction
+def build_neighbors(n_neighbors=50, min_watchers=3, batch_size=10000):
+    users, movies = load_interactions()
+    db.session.query(MovieNeighbor).delete()
+    written = 0
+    batch = []
+    for movie_id, neighbor_id, score in compute_neighbors(users, movies, n_neighbors, min_watchers):
+        batch.append({'movie_id': movie_id, 'neighbor_id': neighbor_id, 'score': score})
+        if len(batch) >= batch_size:
+            db.session.execute(insert(MovieNeighbor), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(MovieNeighbor), batch)
+        written += len(batch)
+    db.session.commit()
+    return written
+
+# "Because you watched X" - neighbours of the user's recent watches merged in memory
+# More recent watches count a little more; movies already watched are skipped
+def because_you_watched(user_id, watched_ids, limit=20):
+    recent = (db.session.query(Watched.movie_id, Watched.movie_title)
+              .filter_by(user_id=user_id)
+              .order_by(Watched.watched_at.desc())
+              .limit(RECENT_WATCHES)
+              .all())
+    if not recent:
+        return []
+
+    recency = {movie_id: 1.0 / (1 + position * 0.1) for position, (movie_id, _) in enumerate(recent)}
+    titles = dict(recent)
+
+    scores = {}
+    because = {}
+    rows = db.session.query(MovieNeighbor.movie_id, MovieNeighbor.neighbor_id, MovieNeighbor.score) \
+        .filter(MovieNeighbor.movie_id.in_(recency))
+    for movie_id, neighbor_id, score in rows:
+        if neighbor_id in watched_ids:
+            continue
+        weighted = score * recency[movie_id]
+        scores[neighbor_id] = scores.get(neighbor_id, 0) + weighted
+        if weighted > because.get(neighbor_id, (0, None))[0]:
+            because[neighbor_id] = (weighted, movie_id)
+
+    top = sorted(scores, key=lambda movie_id: (-scores[movie_id], movie_id))[:limit]
+    catalog = {row.id: row for row in CatalogMovie.query.filter(CatalogMovie.id.in_(top))} if top else {}
+
+    return [{
+        'id': movie_id,
+        'title': catalog[movie_id].title if movie_id in catalog else None,
+        'poster_path': catalog[movie_id].poster_path if movie_id in catalog else None,
+        'score': round(scores[movie_id], 4),
+        'because': titles[because[movie_id][1]]
+    } for movie_id in top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild movie neighbours from the Watched table")
+    parser.add_argument("--neighbors", type=int, default=50, help="neighbours to keep per movie")
+    parser.add_argument("--min-watchers", type=int, default=3, help="skip movies watched by fewer users")
+    args = parser.parse_args()
+
+    from app.factory import create_app
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        written = build_neighbors(args.neighbors, args.min_watchers)
+    print(f"Stored {written} movie neighbours")
@@ -0,0 +1,227 @@
+# App factory - the one place the Flask app is built
+# Run under gunicorn with: gunicorn --preload -w 4 "app.factory:create_app()"
+# With --preload the master builds the app (and whatever APP_PRELOAD names) once before forking,
+# so big read-only structures are shared copy-on-write by every worker instead of loaded per worker
+import gc
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Modules read their settings from the environment at import, so .env is loaded before any of them
+load_dotenv('.env')
+
+from flask import Flask, current_app
+from flask_login import LoginManager
+from models import db, User
+
+login_manager = LoginManager()
+login_manager.login_view = 'views.login'
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    try:
+        return User.query.get(int(user_id))
+    except (ValueError, TypeError):
+        return None
+
+
+# Preload hooks - each builds one shared structure inside an app context
+def _preload_recommender():
+    from app.recommender import get_engine
+    return get_engine()
+
+def _preload_search_index():
+    from app.search_index import get_index
+    return get_index()
+
+def _preload_quiz():
+    from app.quiz import get_profile_table
+    return get_profile_table()
+
+# Only pulls in numpy/scipy-backed modules so workers don't import them on their first request
+def _preload_modules():
+    for module in ('app.recommender', 'app.collab'):
+        importlib.import_module(module)
+
+PRELOAD_HOOKS = {
+    'modules': _preload_modules,
+    'quiz': _preload_quiz,
+    'recommender': _preload_recommender,
+    'search_index': _preload_search_index
+}
+
+# Hook names from APP_PRELOAD ("all" for every hook, empty for none)
+def preload_from_env():
+    names = [name.strip() for name in os.getenv('APP_PRELOAD', '').split(',') if name.strip()]
+    if names == ['all']:
+        return list(PRELOAD_HOOKS)
+    return names
+
+
+# Wall time per startup phase, reported once the app is ready
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000))
+
+    def report(self):
+        total = (time.perf_counter() - self.start) * 1000
+        parts = ', '.join(f"{name} {ms:.0f}ms" for name, ms in self.phases)
+        return f"Startup in {total:.0f}ms (pid {os.getpid()}): {parts}"
+
+    def to_dict(self):
+        return {name: round(ms, 1) for name, ms in self.phases}
+
+
+# Background threads don't survive a fork, so they start with the first request each process serves
+# (the gunicorn master never serves one, and neither does the dev server's reloader parent)
+_background_pid = None
+_background_lock = threading.Lock()
+
+# Only one worker runs the one-off warming jobs: it holds this lease in the shared cache tier (TMDB_CACHE_URL)
+# and renews it; the others keep trying so one takes over if it goes away
+LEASE_SECONDS = 60
+
+# Warm the TMDB results pages /results would ask for (the recommender needs the app context to read the catalog)
+def _prewarm(app):
+    from app.quiz import prewarm_results
+    from app.tmdb_api import get_movies_with_filters
+    with app.app_context():
+        prewarm_results(get_movies_with_filters)
+
+def _start_jobs(app):
+    if os.getenv('QUIZ_PREWARM') == '1':
+        threading.Thread(target=_prewarm, args=(app,), daemon=True).start()
+
+    # Pre-warm popular pages and top quiz results
+    if os.getenv('TMDB_REFRESH') == '1':
+        from app.refresher import start_prewarm
+        start_prewarm(app)
+
+def _run_background(app):
+    from app.tmdb_api import acquire_lease, renew_lease
+    while True:
+        token = acquire_lease('background', LEASE_SECONDS)
+        if not token:
+            time.sleep(LEASE_SECONDS / 2)
+            continue
+        _start_jobs(app)
+        while True:
+            time.sleep(LEASE_SECONDS / 3)
+            if not renew_lease('background', token, LEASE_SECONDS):
+                break
+        # Lost the lease (this process stalled past it) - try for it again with the others
+
+def _start_background():
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+
+    # Read counts are per worker, so every worker refreshes the hot entries its own requests read
+    # (entries another worker has just refreshed are skipped - see tmdb_api.due_for_refresh)
+    if os.getenv('TMDB_REFRESH') == '1':
+        from app.refresher import start_refresher
+        start_refresher()
+
+    if os.getenv('QUIZ_PREWARM') == '1' or os.getenv('TMDB_REFRESH') == '1':
+        threading.Thread(target=_run_background, args=(current_app._get_current_object(),),
+                         name="background-lease", daemon=True).start()
+
+
+def _configure(app):
+    # Set secret key for sessions
+    app.secret_key = os.getenv('SECRET_KEY')
+
+    # Database setup
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': True
+    }
+    # READ COMMITTED is a Postgres level - SQLite (e.g. the benchmark database) keeps its default
+    if not (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['isolation_level'] = 'READ_COMMITTED'
+
+def _register(app):
+    from app.views import views
+    from app.instrumentation import instrument
+    from app.tmdb_api import set_local_source
+    from app.catalog import catalog_source
+
+    app.register_blueprint(views)
+
+    # Timing for TMDB calls, SQL and templates - Server-Timing/JSON logs on sampled requests, histograms at /metrics
+    instrument(app)
+
+    # Answer discover queries from the local catalog first (python -m app.catalog fills it)
+    # "auto" waits for the first finished sync, "1" uses whatever is there, "0" always asks TMDB
+    catalog = os.getenv('CATALOG_ENABLED', 'auto')
+    app.config['CATALOG_ENABLED'] = catalog
+    if catalog != '0':
+        set_local_source(catalog_source(app, require_sync=catalog == 'auto'))
+
+    # Async variants of the TMDB-heavy routes (needs httpx and Flask[async])
+    if os.getenv('TMDB_ASYNC') == '1':
+        from app.async_views import ASYNC_VIEWS
+        app.view_functions.update(ASYNC_VIEWS)
+
+    app.before_request(_start_background)
+
+# Run the named preload hooks (or callables taking no arguments) inside an app context
+def _preload(app, hooks, timer):
+    with app.app_context():
+        for hook in hooks:
+            if callable(hook):
+                name = hook.__name__
+            elif hook in PRELOAD_HOOKS:
+                name, hook = hook, PRELOAD_HOOKS[hook]
+            else:
+                raise ValueError(f"Unknown preload hook {hook!r} (choose from {', '.join(PRELOAD_HOOKS)})")
+            with timer.phase(f"preload:{name}"):
+                hook()
+        # Pooled connections must not be shared with forked workers - they open their own
+        db.engine.dispose()
+
+    # Move everything loaded so far out of the collector's reach; otherwise a collection in a worker
+    # writes to the GC headers of shared objects and copies their pages anyway
+    gc.freeze()
+
+
+# Build the app; preload is a list of hook names/callables (defaults to APP_PRELOAD)
+def create_app(preload=None):
+    timer = StartupTimer()
+
+    with timer.phase('config'):
+        app = Flask(__name__, template_folder='templates', static_folder='static')
+        _configure(app)
+        db.init_app(app)
+        login_manager.init_app(app)
+
+    with timer.phase('routes'):
+        _register(app)
+
+    hooks = preload_from_env() if preload is None else preload
+    if hooks:
+        _preload(app, hooks, timer)
+
+    app.config['STARTUP_TIMINGS'] = timer.to_dict()
+    if os.getenv('STARTUP_REPORT', '1') == '1':
+        print(timer.report(), file=sys.stderr, flush=True)
+    return app
@@ -0,0 +1,126 @@
+# Stateless recommendation feed for infinite scroll
+# Each batch comes with an opaque, signed cursor that holds everything needed to continue:
+# the quiz answers, how far into the local catalog's ranking the feed has got (None once it has run out),
+# the last TMDB page used and the ids already sent - so nothing about the scroll position is kept on the server
+import os
+from collections import deque, namedtuple
+from contextlib import closing
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from app.quiz import encode_answers, lookup_profile
+from app.tmdb_api import discover_page, iter_pages
+
+# Ids a cursor remembers - keeps it to a few hundred bytes; anything older may be recommended again
+SEEN_LIMIT = int(os.getenv('FEED_SEEN_LIMIT', 200))
+
+# Movies per request unless the client asks for a different number
+BATCH_SIZE = 20
+
+# TMDB pages one request reads looking for new movies (a window at a time, see tmdb_api.page_window)
+MAX_PAGES = 10
+
+Cursor = namedtuple('Cursor', ['answers', 'page', 'offset', 'seen'])
+
+
+# Signed with the app's secret key - a client can pass a cursor back but can't forge or edit one
+# (itsdangerous also compresses the payload when that makes it shorter)
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='recommendation-feed')
+
+# A feed needs a finished quiz: one in-range option index per question
+def valid_answers(answers):
+    return (isinstance(answers, list) and all(type(answer) is int for answer in answers)
+            and encode_answers(answers) is not None)
+
+def dump_cursor(cursor):
+    return _serializer().dumps([cursor.answers, cursor.page, cursor.offset, list(cursor.seen)[-SEEN_LIMIT:]])
+
+# Cursor from a token - None if the signature or the contents don't check out
+def load_cursor(token):
+    try:
+        answers, page, offset, seen = _serializer().loads(token)
+    except (BadSignature, ValueError, TypeError):
+        return None
+    if not isinstance(page, int) or page < 0 or not valid_answers(answers):
+        return None
+    if offset is not None and (not isinstance(offset, int) or offset < 0):
+        return None
+    return Cursor(answers, page, offset, seen)
+
+# Cursor for a fresh set of answers, or for the movies a results page already shows
+# (offset is how many catalog recommendations it shows, None if it came from TMDB)
+def start_cursor(answers, shown=(), page=0, offset=0):
+    if not valid_answers(list(answers)):
+        return None
+    return Cursor(list(answers), page, offset, list(shown)[-SEEN_LIMIT:])
+
+
+# Batches of new movies for a cursor, each yielded with the cursor that continues after it
+# (None once there is nothing left). The local catalog is used first; once it falls short, TMDB discover pages
+# are fetched a few at a time and each one is yielded as soon as it arrives. Always yields at least once.
+# A TMDB page that fails (an error, or out of quota) ends the request with a None batch and a cursor that
+# starts on that page, so the client can try again later instead of taking it for the end of the feed.
+def feed_batches(cursor, exclude=(), limit=BATCH_SIZE):
+    profile = lookup_profile(cursor.answers)
+    preferences = profile.preferences._asdict()
+    preferences['genres'] = list(preferences['genres'])
+    seen = deque(cursor.seen, maxlen=SEEN_LIMIT)
+    skip = set(cursor.seen) | set(exclude)
+    sent = 0
+
+    if cursor.offset is not None:
+        # numpy-backed, so only imported by workers that serve the feed
+        from app.recommender import recommend
+        # The offset walks down the ranking (which only leaves out watched movies), so a long scroll
+        # never comes back round to movies that have dropped out of the seen ids
+        movies = recommend(dict(profile.genre_scores), preferences, exclude=exclude, k=limit, offset=cursor.offset)
+        new_movies = [movie for movie in movies if movie['id'] not in skip]
+        skip.update(movie['id'] for movie in new_movies)
+        seen.extend(movie['id'] for movie in new_movies)
+        if len(movies) == limit:
+            yield new_movies, Cursor(cursor.answers, 0, cursor.offset + limit, list(seen))
+            return
+
+        # The catalog has nothing more for these answers - the rest comes from TMDB
+        sent = len(new_movies)
+        if new_movies:
+            yield new_movies, Cursor(cursor.answers, 0, None, list(seen))
+
+    last_page = cursor_page = cursor.page
+    pages = range(cursor.page + 1, cursor.page + 1 + MAX_PAGES)
+    failed = set()
+
+    def fetch(page):
+        movies = discover_page(**preferences, page=page)
+        if movies is None:
+            failed.add(page)
+        return movies
+
+    with closing(iter_pages(fetch, pages)) as results:
+        for page, movies in results:
+            last_page = page
+            new_movies = []
+            for movie in movies:
+                if movie['id'] not in skip:
+                    skip.add(movie['id'])
+                    new_movies.append(movie)
+            if not new_movies:
+                continue
+
+            # Whole pages only (a batch can run a little over limit), so the next request starts on a page
+            # nobody has read yet instead of fetching this one again
+            sent += len(new_movies)
+            seen.extend(movie['id'] for movie in new_movies)
+            cursor_page = page
+            yield new_movies, Cursor(cursor.answers, page, None, list(seen))
+            if sent >= limit:
+                return
+
+    # The page after the last one read failed rather than came back empty - resume from it next time
+    if last_page + 1 in failed:
+        yield None, Cursor(cursor.answers, last_page, None, list(seen))
+    # TMDB ran out of pages before MAX_PAGES: the feed is over once everything found has been sent
+    elif last_page < pages[-1]:
+        yield [], None
+    elif last_page > cursor_page:
+        yield [], Cursor(cursor.answers, last_page, None, list(seen))
@@ -0,0 +1,51 @@
+# Rendered-fragment cache and HTTP caching headers for pages
+# Templates wrap the user-independent parts of a page in {% call cached_fragment('movie-card', movie) %},
+# so they are rendered once per process and reused for every user; per-user bits stay outside the block
+import os
+import zlib
+from flask import make_response, request
+from markupsafe import Markup
+from app.cache import LRUCache
+
+FRAGMENT_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', 3600))
+
+# How long browsers and reverse proxies may reuse a public page without asking again
+PUBLIC_MAX_AGE = int(os.getenv('PUBLIC_PAGE_MAX_AGE', 300))
+
+_fragments = LRUCache(maxsize=int(os.getenv('FRAGMENT_CACHE_SIZE', 5000)), ttl=FRAGMENT_TTL)
+
+
+# Jinja call block: return the cached HTML for this kind of fragment of a movie, rendering the block body on a miss
+# The key includes a checksum of the record, so once the TMDB entry behind it is refreshed with new data
+# the fragment is rendered again instead of serving the old version until FRAGMENT_TTL runs out
+def cached_fragment(name, record, caller):
+    key = (name, record['id'], zlib.crc32(repr(record).encode()))
+    html = _fragments.get(key)
+    if html is None:
+        html = str(caller())
+        _fragments.set(key, html)
+    return Markup(html)
+
+def clear_fragments():
+    _fragments.clear()
+
+def get_fragment_stats():
+    return _fragments.stats()
+
+
+# Response for a rendered page with an ETag, answering conditional requests with 304
+# No Last-Modified: the body also depends on per-user data (watched state), which fragment times know nothing about
+# Public pages may be stored by shared caches; the rest are private and revalidated on every use
+def cached_page(html, public=False):
+    response = make_response(html)
+    response.add_etag()
+
+    if public:
+        response.cache_control.public = True
+        response.cache_control.max_age = PUBLIC_MAX_AGE
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    # Guests and logged-in users get different HTML at the same URL
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
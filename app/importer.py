@@ -0,0 +1,188 @@
+# Bulk import of watched/watchlist movies (e.g. Letterboxd or IMDb exports)
+# Rows are resolved to TMDB ids in batches and written with one INSERT ... ON CONFLICT DO NOTHING
+import csv
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from models import db, CatalogMovie, Watched, Watchlist, bulk_upsert
+from app.tmdb_api import get_movie, search_movies, find_by_imdb_id
+
+MAX_IMPORT_ROWS = 2000
+RESOLVE_WORKERS = 8
+
+# Rows the catalog can't resolve each cost a TMDB call inside the request - past this many they are
+# reported as "lookup_limit" (send them again in another import) so the request stays well under the worker timeout
+MAX_LOOKUP_ROWS = int(os.getenv('IMPORT_MAX_LOOKUPS', 200))
+
+IMPORT_MODELS = {
+    'watched': Watched,
+    'watchlist': Watchlist
+}
+
+# CSV headers we understand - ours, Letterboxd (Name, Year) and IMDb (Const, Title, Year)
+ID_COLUMNS = ['movie_id', 'tmdb_id', 'id']
+IMDB_COLUMNS = ['imdb_id', 'Const', 'const']
+TITLE_COLUMNS = ['title', 'Title', 'Name', 'name']
+YEAR_COLUMNS = ['year', 'Year']
+
+# Ids have to fit the INTEGER columns they are written to; years outside this range are typos
+MAX_MOVIE_ID = 2 ** 31 - 1
+YEAR_RANGE = range(1870, 2101)
+
+
+def _first(row, columns):
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ''):
+            return str(value).strip()
+    return None
+
+# Digit string as an int if it is in range, else None
+def _bounded_int(value, valid):
+    if not value or not value.isdigit():
+        return None
+    number = int(value)
+    return number if number in valid else None
+
+# Normalise one JSON object or CSV row into {'movie_id', 'imdb_id', 'title', 'year'}
+# (None if it has nothing to go on, or an id or year that can't be right)
+def parse_row(row):
+    if isinstance(row, (int, str)) and str(row).isdigit():
+        row = {'movie_id': row}
+    if not isinstance(row, dict):
+        return None
+
+    movie_id = _first(row, ID_COLUMNS)
+    year = _first(row, YEAR_COLUMNS)
+    item = {
+        'movie_id': _bounded_int(movie_id, range(1, MAX_MOVIE_ID + 1)),
+        'imdb_id': _first(row, IMDB_COLUMNS),
+        'title': _first(row, TITLE_COLUMNS),
+        'year': _bounded_int(year, YEAR_RANGE)
+    }
+    if (movie_id and item['movie_id'] is None) or (year and item['year'] is None):
+        return None
+    if not item['movie_id'] and not item['imdb_id'] and not item['title']:
+        return None
+    return item
+
+# Read rows from an uploaded CSV file - ValueError if it isn't one we can parse
+def read_csv(file_storage):
+    text = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', errors='replace')
+    try:
+        return list(csv.DictReader(text))
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Could not read the CSV file: {e}")
+
+# Best search result for a title, preferring one released in the given year
+def _search_title(title, year):
+    results = search_movies(title)
+    if year:
+        for movie in results:
+            if (movie.get('release_date') or '')[:4] == str(year):
+                return movie
+    return results[0] if results else None
+
+# Fill in movie_id, title and poster for every item, and return them with the indexes of items left unresolved
+# because they were over MAX_LOOKUP_ROWS
+# Catalog lookups are one query each for ids and titles, the rest go to TMDB in parallel
+def resolve(items):
+    resolved = [None] * len(items)
+
+    ids = {item['movie_id'] for item in items if item and item['movie_id']}
+    by_id = {}
+    if ids:
+        for row in CatalogMovie.query.filter(CatalogMovie.id.in_(ids)):
+            by_id[row.id] = {'id': row.id, 'title': row.title, 'poster_path': row.poster_path}
+
+    titles = {item['title'].lower() for item in items if item and not item['movie_id'] and not item['imdb_id'] and item['title']}
+    by_title = {}
+    if titles:
+        rows = CatalogMovie.query.filter(func.lower(CatalogMovie.title).in_(titles)).order_by(CatalogMovie.popularity.desc())
+        for row in rows:
+            movie = {'id': row.id, 'title': row.title, 'poster_path': row.poster_path}
+            by_title.setdefault((row.title.lower(), row.release_year), movie)
+            by_title.setdefault((row.title.lower(), None), movie)
+
+    # Anything the catalog doesn't know goes to TMDB
+    lookups = {}
+    for i, item in enumerate(items):
+        if item is None:
+            continue
+        if item['movie_id']:
+            if item['movie_id'] in by_id:
+                resolved[i] = by_id[item['movie_id']]
+            else:
+                lookups[i] = (get_movie, (item['movie_id'],))
+        elif item['imdb_id']:
+            lookups[i] = (find_by_imdb_id, (item['imdb_id'],))
+        else:
+            key = item['title'].lower()
+            movie = by_title.get((key, item['year'])) or by_title.get((key, None))
+            if movie:
+                resolved[i] = movie
+            else:
+                lookups[i] = (_search_title, (item['title'], item['year']))
+
+    skipped = set(list(lookups)[MAX_LOOKUP_ROWS:])
+    for i in skipped:
+        del lookups[i]
+
+    if lookups:
+        with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as executor:
+            futures = {i: executor.submit(fetch, *args) for i, (fetch, args) in lookups.items()}
+            for i, future in futures.items():
+                movie = future.result()
+                if movie:
+                    resolved[i] = {'id': movie['id'], 'title': movie.get('title') or 'Unknown Movie',
+                                   'poster_path': movie.get('poster_path') or ''}
+    return resolved, skipped
+
+# Import rows into the user's watched list or watchlist and report what happened to each row
+def import_movies(user_id, rows, list_name='watched'):
+    model = IMPORT_MODELS[list_name]
+    rows = rows[:MAX_IMPORT_ROWS]
+    items = [parse_row(row) for row in rows]
+    movies, skipped = resolve(items)
+
+    # One query for everything the user already has in this list
+    movie_ids = {movie['id'] for movie in movies if movie}
+    existing = set()
+    if movie_ids:
+        existing = {movie_id for (movie_id,) in db.session.query(model.movie_id)
+                    .filter(model.user_id == user_id, model.movie_id.in_(movie_ids))}
+
+    results = []
+    new_rows = {}
+    for i, (item, movie) in enumerate(zip(items, movies)):
+        if item is None:
+            results.append({'row': i, 'status': 'invalid'})
+            continue
+        if i in skipped:
+            results.append({'row': i, 'status': 'lookup_limit', 'title': item['title']})
+            continue
+        if movie is None:
+            results.append({'row': i, 'status': 'not_found', 'title': item['title']})
+            continue
+
+        result = {'row': i, 'movie_id': movie['id'], 'title': movie['title']}
+        if movie['id'] in existing:
+            result['status'] = 'already_present'
+        elif movie['id'] in new_rows:
+            result['status'] = 'duplicate'
+        else:
+            result['status'] = 'imported'
+            new_rows[movie['id']] = {'user_id': user_id, 'movie_id': movie['id'],
+                                     'movie_title': movie['title'][:200], 'movie_poster': movie['poster_path']}
+        results.append(result)
+
+    # Single bulk write - rows added concurrently by another request are skipped by ON CONFLICT
+    bulk_upsert(model, list(new_rows.values()), ['user_id', 'movie_id'])
+    db.session.commit()
+
+    return {
+        'list': list_name,
+        'imported': len(new_rows),
+        'rows': results
+    }
@@ -0,0 +1,222 @@
+# Per-request instrumentation: timing spans for TMDB calls, SQL queries and template rendering
+# Every request feeds the latency histograms served at /metrics (a lock and a few increments each);
+# a sampled share of requests also keeps individual spans, gets a Server-Timing header and a JSON log line
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SAMPLE_RATE = float(os.getenv('INSTRUMENT_SAMPLE_RATE', 0.05))
+
+# Histogram bucket bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Spans kept per sampled request (a runaway loop shouldn't grow the log line forever)
+MAX_SPANS = 200
+
+logger = logging.getLogger('app.instrumentation')
+
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+# Prometheus histogram with a fixed set of label names
+class Histogram:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, seconds, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(BUCKETS) + 1), 0.0]
+            series[0][bisect_left(BUCKETS, seconds)] += 1
+            series[1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{{{base}{',' if base else ''}le=\"{le}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+# Prometheus counter with a fixed set of label names
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time spent handling a request',
+                            ('method', 'route', 'status'))
+TMDB_SECONDS = Histogram('tmdb_request_duration_seconds', 'TMDB API call latency', ('endpoint', 'status'))
+TMDB_BYTES = Counter('tmdb_response_bytes_total', 'Bytes received from the TMDB API', ('endpoint',))
+DB_SECONDS = Histogram('db_query_duration_seconds', 'SQL query latency', ('statement',))
+RENDER_SECONDS = Histogram('template_render_duration_seconds', 'Jinja template render time', ('template',))
+
+METRICS = [REQUEST_SECONDS, TMDB_SECONDS, TMDB_BYTES, DB_SECONDS, RENDER_SECONDS]
+
+
+# Spans of one sampled request - shared with worker threads through the copied context
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, ms, **attrs):
+        with self._lock:
+            count, total = self.totals.get(kind, (0, 0.0))
+            self.totals[kind] = (count + 1, total + ms)
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append({'kind': kind, 'name': name, 'ms': round(ms, 2),
+                                   'at_ms': round(max(0.0, (time.perf_counter() - self.start) * 1000 - ms), 2), **attrs})
+
+def _span(kind, name, ms, **attrs):
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(kind, name, ms, **attrs)
+
+
+# Called by tmdb_api for every TMDB call (status is None when the call never got a response,
+# 'throttled' when the rate limiter turned it away)
+def record_tmdb(endpoint, status, size, ms):
+    TMDB_SECONDS.observe(ms / 1000, endpoint, str(status or 'error'))
+    if size:
+        TMDB_BYTES.inc(size, endpoint)
+    _span('tmdb', endpoint, ms, status=status, bytes=size)
+
+
+# SQL timing through SQLAlchemy engine events (every engine, including ones created later)
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    DB_SECONDS.observe(ms / 1000, verb)
+    _span('db', verb, ms, statement=statement[:200])
+
+def _query_failed(context):
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+# Template timing through Flask's render signals
+def _before_render(sender, template, context, **extra):
+    g.setdefault('render_starts', []).append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    ms = (time.perf_counter() - g.render_starts.pop()) * 1000
+    RENDER_SECONDS.observe(ms / 1000, template.name)
+    _span('render', template.name, ms)
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    if random.random() < SAMPLE_RATE:
+        _trace.set(Trace())
+
+def _finish_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    ms = (time.perf_counter() - start) * 1000
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(ms / 1000, request.method, route, str(response.status_code))
+
+    trace = _trace.get()
+    if trace is not None:
+        response.headers['Server-Timing'] = server_timing(trace, ms)
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'ms': round(ms, 2),
+            'totals': {kind: {'count': count, 'ms': round(total, 2)} for kind, (count, total) in trace.totals.items()},
+            'spans': trace.spans
+        }))
+    return response
+
+def _end_request(exc):
+    _trace.set(None)
+
+# Server-Timing header: one entry per span kind plus the total
+# TMDB calls made in parallel add up to more than the wall time, so the count goes in desc
+def server_timing(trace, total_ms):
+    entries = [f'{kind};dur={total:.1f};desc="n={count}"' for kind, (count, total) in sorted(trace.totals.items())]
+    entries.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(entries)
+
+
+# Prometheus text exposition of every metric
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Hook instrumentation into the app, SQLAlchemy and template rendering
+def instrument(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_query):
+        event.listen(Engine, 'before_cursor_execute', _before_query)
+        event.listen(Engine, 'after_cursor_execute', _after_query)
+        event.listen(Engine, 'handle_error', _query_failed)
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
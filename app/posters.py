@@ -0,0 +1,153 @@
+# Poster proxy with an on-disk cache
+# Posters are fetched from TMDB's image CDN once per size, kept in a sharded directory tree
+# and served with long-lived cache headers; the least recently served files are evicted past a disk budget
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+from app.cache import SingleFlight
+from app.tmdb_api import get_session, CONNECT_TIMEOUT, READ_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+IMAGE_BASE_URL = os.getenv('TMDB_IMAGE_BASE_URL', 'https://image.tmdb.org/t/p')
+
+# Size variants TMDB renders for posters - used instead of resizing images ourselves
+POSTER_SIZES = ('w92', 'w154', 'w185', 'w342', 'w500', 'w780', 'original')
+
+# Default size for the 150px grid cards (the details page asks for w342)
+GRID_SIZE = 'w185'
+
+POSTER_CACHE_DIR = os.getenv('POSTER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'movie_recommender_posters'))
+POSTER_CACHE_BYTES = int(os.getenv('POSTER_CACHE_MB', 500)) * 1024 * 1024
+
+# Eviction trims the cache down to this share of the budget so it doesn't run on every write
+EVICT_TO = 0.9
+
+# Only bump a file's mtime (the LRU clock) when it is older than this
+TOUCH_SECONDS = 3600
+
+# Browsers and proxies may keep a poster for a year - a TMDB file path never changes content
+MAX_AGE = 365 * 24 * 3600
+
+# TMDB image file names look like "/kqjL17yufvn9OVLyXYpvtyrFfak.jpg"
+POSTER_NAME = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|jpeg|png|webp)$")
+
+MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp'
+}
+
+_flights = SingleFlight()
+_disk_lock = threading.Lock()
+_disk_bytes = None
+
+
+# Is this a size and file name we are willing to proxy?
+def valid_poster(size, name):
+    return size in POSTER_SIZES and POSTER_NAME.match(name) is not None
+
+def poster_mimetype(name):
+    return MIMETYPES[name.rsplit('.', 1)[1].lower()]
+
+# Strong validator for a cached poster - the same size and file name always hold the same bytes
+def poster_etag(size, name):
+    return hashlib.sha1(f"{size}/{name}".encode()).hexdigest()
+
+# Where a poster lives on disk, sharded two levels deep so no directory gets huge
+def poster_file(size, name):
+    digest = poster_etag(size, name)
+    return os.path.join(POSTER_CACHE_DIR, digest[:2], digest[2:4], f"{size}_{name}")
+
+def tmdb_poster_url(size, name):
+    return f"{IMAGE_BASE_URL}/{size}/{name}"
+
+
+def _scan():
+    for root, _, files in os.walk(POSTER_CACHE_DIR):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+# Delete the least recently served posters until the cache is back under budget
+def _evict():
+    global _disk_bytes
+    files = sorted(_scan())
+    total = sum(size for _, size, _ in files)
+    target = POSTER_CACHE_BYTES * EVICT_TO
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    _disk_bytes = total
+
+# Add a newly written poster to the running total (the first call per process scans the directory instead)
+def _account(size):
+    global _disk_bytes
+    with _disk_lock:
+        if _disk_bytes is None:
+            _disk_bytes = sum(file_size for _, file_size, _ in _scan())
+        else:
+            _disk_bytes += size
+        if _disk_bytes > POSTER_CACHE_BYTES:
+            _evict()
+
+# Mark a cached poster as recently used
+def _touch(path):
+    try:
+        if time.time() - os.path.getmtime(path) > TOUCH_SECONDS:
+            os.utime(path)
+    except OSError:
+        pass
+
+
+# Download a poster into the cache - True if it is on disk afterwards
+def _download(size, name, path):
+    if os.path.exists(path):
+        return True
+    try:
+        response = get_session().get(tmdb_poster_url(size, name), timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    except (requests.RequestException, OSError) as e:
+        logger.warning("Poster fetch failed for %s/%s: %s", size, name, e)
+        return False
+    if response.status_code != 200 or not response.content:
+        return False
+
+    # Write to a temp file and rename so readers never see a half-written poster
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    _account(len(response.content))
+    return True
+
+# Path of the cached poster, fetching it first if needed - None if TMDB didn't deliver it
+# Concurrent requests for the same poster share one download
+def get_poster(size, name):
+    path = poster_file(size, name)
+    if os.path.exists(path):
+        _touch(path)
+        return path
+    if _flights.do(path, lambda: _download(size, name, path)):
+        return path
+    return None
@@ -0,0 +1,180 @@
+# Quiz questions and the precompiled answers -> preferences table
+# Every complete set of answers is worked out once per process, so /results is a single lookup
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from app.rate_limit import PREFETCH, with_priority
+
+# Quiz questions - each has genres and weights
+QUIZ_QUESTIONS = [
+    {
+        "question": "What's your ideal Friday night?",
+        "options": [
+            {"text": "Intense action and explosions", "genres": [28], "weight": 2},
+            {"text": "Laughing with friends", "genres": [35], "weight": 2},
+            {"text": "Deep emotional story", "genres": [18], "weight": 2},
+            {"text": "Getting scared", "genres": [27], "weight": 2}
+        ]
+    },
+    {
+        "question": "How much time do you have?",
+        "options": [
+            {"text": "Quick watch (under 90 min)", "max_runtime": 90, "weight": 1},
+            {"text": "Standard movie (90-120 min)", "min_runtime": 90, "max_runtime": 120, "weight": 1},
+            {"text": "Epic experience (2+ hours)", "min_runtime": 120, "weight": 1},
+            {"text": "I don't care about length", "weight": 0}
+        ]
+    },
+    {
+        "question": "What era appeals to you?",
+        "options": [
+            {"text": "Classic films (before 1980)", "max_year": 1979, "weight": 1},
+            {"text": "80s & 90s nostalgia", "min_year": 1980, "max_year": 1999, "weight": 1},
+            {"text": "Modern movies (2000s-2010s)", "min_year": 2000, "max_year": 2019, "weight": 1},
+            {"text": "Latest releases (2020+)", "min_year": 2020, "weight": 1}
+        ]
+    },
+    {
+        "question": "What kind of quality are you looking for?",
+        "options": [
+            {"text": "Critically acclaimed (8+ rating)", "min_rating": 8.0, "sort": "vote_average.desc", "weight": 1},
+            {"text": "Popular crowd-pleasers", "sort": "popularity.desc", "weight": 1},
+            {"text": "Hidden gems (fewer votes)", "sort": "vote_count.asc", "weight": 1},
+            {"text": "I'm not picky", "weight": 0}
+        ]
+    },
+    {
+        "question": "What setting excites you most?",
+        "options": [
+            {"text": "Space and future", "genres": [878], "weight": 1},
+            {"text": "Fantasy worlds", "genres": [14], "weight": 1},
+            {"text": "Real world drama", "genres": [18], "weight": 1},
+            {"text": "Crime and mystery", "genres": [80, 9648], "weight": 1}
+        ]
+    },
+    {
+        "question": "How do you want to feel afterward?",
+        "options": [
+            {"text": "Pumped and energized", "genres": [28, 12], "weight": 2},
+            {"text": "Happy and uplifted", "genres": [35, 10751], "weight": 2},
+            {"text": "Thoughtful and moved", "genres": [18], "weight": 2},
+            {"text": "Thrilled and tense", "genres": [53, 27], "weight": 2}
+        ]
+    }
+]
+
+# Quiz filters in the shape get_movies_with_filters takes
+Preferences = namedtuple('Preferences', ['genres', 'min_year', 'max_year', 'min_runtime',
+                                         'max_runtime', 'min_rating', 'sort_by'])
+
+# Everything /results needs for one set of answers - equal for answers that lead to the same results
+QuizProfile = namedtuple('QuizProfile', ['preferences', 'genre_scores'])
+
+
+# Work out preferences and genre weights from a list of answers
+def build_profile(answers):
+    preferences = {
+        'genres': [],
+        'min_year': None,
+        'max_year': None,
+        'min_runtime': None,
+        'max_runtime': None,
+        'min_rating': None,
+        'sort_by': 'popularity.desc'
+    }
+    
+    # Calculate genre scores based on quiz answers
+    genre_scores = {}
+    
+    for i, answer in enumerate(answers):
+        if i < len(QUIZ_QUESTIONS):
+            question = QUIZ_QUESTIONS[i]
+            selected_option = question['options'][answer]
+            
+            # Add genre scores with weights
+            if 'genres' in selected_option:
+                for genre_id in selected_option['genres']:
+                    weight = selected_option.get('weight', 1)
+                    genre_scores[genre_id] = genre_scores.get(genre_id, 0) + weight
+            
+            # Set other preferences from quiz answers
+            for field in ('min_year', 'max_year', 'min_runtime', 'max_runtime', 'min_rating'):
+                if field in selected_option:
+                    preferences[field] = selected_option[field]
+            if 'sort' in selected_option:
+                preferences['sort_by'] = selected_option['sort']
+    
+    # Get top 3 genres based on scores
+    if genre_scores:
+        top_genres = sorted(genre_scores.items(), key=lambda x: x[1], reverse=True)[:3]
+        preferences['genres'] = [genre_id for genre_id, score in top_genres]
+    
+    preferences = Preferences(**{**preferences, 'genres': tuple(preferences['genres'])})
+    genre_scores = tuple(genre_scores.items())
+    return QuizProfile(preferences, genre_scores)
+
+# Number of options for each question, used to encode answers as one integer
+OPTION_COUNTS = [len(question['options']) for question in QUIZ_QUESTIONS]
+
+# Mixed-radix code for a complete set of answers (None if incomplete or out of range)
+def encode_answers(answers):
+    if len(answers) != len(OPTION_COUNTS):
+        return None
+    code = 0
+    for answer, count in zip(answers, OPTION_COUNTS):
+        if not 0 <= answer < count:
+            return None
+        code = code * count + answer
+    return code
+
+# Every complete answer combination (4^6 = 4096), indexed by encode_answers
+# Built on first use (or by the "quiz" preload hook) rather than at import, to keep startup fast
+_profile_table = None
+_profile_lock = threading.Lock()
+
+def get_profile_table():
+    global _profile_table
+    if _profile_table is None:
+        with _profile_lock:
+            if _profile_table is None:
+                _profile_table = [build_profile(list(answers))
+                                  for answers in product(*(range(count) for count in OPTION_COUNTS))]
+    return _profile_table
+
+# Profile for a list of answers - a table lookup for complete quizzes, None for invalid answers
+def lookup_profile(answers):
+    code = encode_answers(answers)
+    if code is not None:
+        return get_profile_table()[code]
+    try:
+        return build_profile(answers)
+    except (IndexError, TypeError):
+        return None
+
+# Discover queries /results really sends to TMDB, likeliest first: it ranks the local catalog before anything else
+# and only asks for discover page 1 when that finds nothing, and discover itself is answered from the catalog
+# when it can be. With no catalog loaded that is every distinct query. Needs an app context (the recommender)
+def tmdb_result_preferences(limit=None):
+    from app.recommender import recommend
+    from app.tmdb_api import local_movies
+    wanted = {}
+    for profile, _ in Counter(get_profile_table()).most_common():
+        if profile.preferences in wanted:
+            continue
+        filters = dict(profile.preferences._asdict(), genres=list(profile.preferences.genres))
+        if recommend(dict(profile.genre_scores), filters) or local_movies(**filters, page=1):
+            continue
+        wanted[profile.preferences] = True
+        if len(wanted) == limit:
+            break
+    return list(wanted)
+
+# Fetch the first TMDB results page for every quiz profile whose /results goes to TMDB, so the cache is warm
+# fetch is get_movies_with_filters (or anything with the same signature)
+def prewarm_results(fetch, workers=4, limit=None):
+    preferences = tmdb_result_preferences(limit)
+    fetch = with_priority(PREFETCH, fetch)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda prefs: fetch(**prefs._asdict(), page=1), preferences))
+    return len(preferences)
@@ -0,0 +1,99 @@
+# Server-side quiz state
+# The session cookie only carries a random id, answers/preferences/shown movies live in a store:
+# the QuizSession table by default, or Redis when QUIZ_STORE_URL=redis://...
+import json
+import os
+import secrets
+from collections import deque
+from datetime import datetime, timedelta
+from flask import session
+from models import db, QuizSession, bulk_upsert
+
+# Only the most recent shown movies are remembered, so state stays the same size however often users refresh
+SHOWN_LIMIT = int(os.getenv('QUIZ_SHOWN_LIMIT', 500))
+
+# Quiz state not touched for this long is removed
+STATE_TTL = timedelta(days=int(os.getenv('QUIZ_STATE_DAYS', 7)))
+
+
+class QuizState:
+    def __init__(self, sid, data=None):
+        data = data or {}
+        self.sid = sid
+        self.answers = data.get('answers', [])
+        self.preferences = data.get('preferences')
+        self.genre_scores = data.get('genre_scores', {})
+        self.current_page = data.get('current_page', 1)
+        # Ring buffer of movie ids already shown - oldest ids drop off once it's full
+        self.shown = deque(data.get('shown', []), maxlen=SHOWN_LIMIT)
+
+    def mark_shown(self, movie_ids):
+        self.shown.extend(movie_ids)
+
+    def reset_shown(self, movie_ids=()):
+        self.shown.clear()
+        self.shown.extend(movie_ids)
+
+    def to_dict(self):
+        return {
+            'answers': self.answers,
+            'preferences': self.preferences,
+            'genre_scores': self.genre_scores,
+            'current_page': self.current_page,
+            'shown': list(self.shown)
+        }
+
+
+# Quiz state in the QuizSession table
+class SQLQuizStore:
+    def __init__(self):
+        self._saves = 0
+
+    def load(self, sid):
+        row = db.session.get(QuizSession, sid)
+        return json.loads(row.data) if row else None
+
+    def save(self, sid, data):
+        bulk_upsert(QuizSession, [{'id': sid, 'data': json.dumps(data), 'updated_at': datetime.utcnow()}],
+                    ['id'], ['data', 'updated_at'])
+        self._saves += 1
+        if self._saves % 1000 == 0:
+            QuizSession.query.filter(QuizSession.updated_at < datetime.utcnow() - STATE_TTL).delete()
+        db.session.commit()
+
+
+# Quiz state in Redis - needs the optional redis package
+class RedisQuizStore:
+    def __init__(self, url, prefix="quiz:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        raw = self.client.get(self.prefix + sid)
+        return json.loads(raw) if raw else None
+
+    def save(self, sid, data):
+        self.client.set(self.prefix + sid, json.dumps(data), ex=int(STATE_TTL.total_seconds()))
+
+
+def _make_store(url):
+    if url and (url.startswith("redis://") or url.startswith("rediss://")):
+        return RedisQuizStore(url)
+    return SQLQuizStore()
+
+_store = _make_store(os.getenv('QUIZ_STORE_URL'))
+
+
+# Quiz state for the current visitor (a fresh one if they don't have any yet)
+def load_quiz_state():
+    sid = session.get('quiz_sid')
+    data = _store.load(sid) if sid else None
+    if data is None:
+        sid = secrets.token_urlsafe(24)
+    return QuizState(sid, data)
+
+def save_quiz_state(state):
+    _store.save(state.sid, state.to_dict())
+    if session.get('quiz_sid') != state.sid:
+        session['quiz_sid'] = state.sid
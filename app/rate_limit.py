@@ -0,0 +1,259 @@
+# Client-side rate limiter for TMDB traffic
+# A token bucket (per process, or shared by all workers through SQLite/Redis) with priority classes:
+# page loads go first, prefetch and background jobs only use tokens while there is headroom
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Priority classes - lower numbers are served first
+INTERACTIVE = 0
+PREFETCH = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PREFETCH: "prefetch", BACKGROUND: "background"}
+
+# Share of the bucket each class must leave untouched, so lower classes can't starve page loads
+RESERVE = {INTERACTIVE: 0.0, PREFETCH: 0.25, BACKGROUND: 0.5}
+
+_priority = contextvars.ContextVar('tmdb_priority', default=INTERACTIVE)
+
+
+# Run TMDB calls in this block at the given priority
+@contextmanager
+def priority(level):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# Wrap fn so it runs at the given priority in whatever thread calls it (e.g. executor workers)
+def with_priority(level, fn):
+    def wrapper(*args, **kwargs):
+        with priority(level):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def current_priority():
+    return _priority.get()
+
+
+# Token bucket for this process only
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Take a token if at least `reserve` of the bucket would be left - returns 0, or seconds to wait
+    def take(self, reserve=0.0):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            needed = 1 + reserve * self.burst
+            if self._tokens >= needed:
+                self._tokens -= 1
+                return 0
+            return (needed - self._tokens) / self.rate
+
+
+# Token bucket stored in a SQLite file - shared by every worker on the host
+class SQLiteTokenBucket:
+    def __init__(self, path, rate, burst, name="tmdb"):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, burst, time.time()))
+
+    # Per thread and per process, like SQLiteCache._conn
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, reserve=0.0):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            needed = 1 + reserve * self.burst
+            wait = 0
+            if tokens >= needed:
+                tokens -= 1
+            else:
+                wait = (needed - tokens) / self.rate
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+            conn.execute("COMMIT")
+            return wait
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return 0
+
+
+# Token bucket in Redis, updated atomically by a Lua script
+class RedisTokenBucket:
+    SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst, needed = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= needed then tokens = tokens - 1 else wait = (needed - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+    def __init__(self, url, rate, burst, name="tmdb"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.rate = rate
+        self.burst = burst
+        self.key = f"ratelimit:{name}"
+        self._script = self.client.register_script(self.SCRIPT)
+        self._errors = redis.RedisError
+
+    def take(self, reserve=0.0):
+        try:
+            return float(self._script(keys=[self.key], args=[self.rate, self.burst, 1 + reserve * self.burst]))
+        except self._errors:
+            return 0
+
+
+# Hands out tokens in priority order with a bounded wait queue
+class RateLimiter:
+    def __init__(self, bucket, max_queue=100, timeout=5.0):
+        self.bucket = bucket
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._stats = {name: {"acquired": 0, "queued": 0, "throttled": 0, "wait_ms": 0.0}
+                       for name in PRIORITY_NAMES.values()}
+
+    # outcome is "acquired" or "throttled" - queued means the caller had to wait
+    def _record(self, level, outcome, queued, start):
+        with self._cond:
+            stats = self._stats[PRIORITY_NAMES[level]]
+            stats[outcome] += 1
+            if queued:
+                stats["queued"] += 1
+            stats["wait_ms"] += (time.monotonic() - start) * 1000
+
+    # Wait for a token - False if the queue is full or none came within the timeout
+    def acquire(self, level=None, timeout=None):
+        level = current_priority() if level is None else level
+        start = time.monotonic()
+        deadline = start + (self.timeout if timeout is None else timeout)
+
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                ticket = None
+            else:
+                ticket = (level, next(self._seq))
+                heapq.heappush(self._waiting, ticket)
+        if ticket is None:
+            self._record(level, "throttled", False, start)
+            return False
+
+        queued = False
+        try:
+            while True:
+                # Only the front of the queue (highest priority, then oldest) asks the bucket
+                with self._cond:
+                    while self._waiting[0] != ticket and time.monotonic() < deadline:
+                        queued = True
+                        self._cond.wait(deadline - time.monotonic())
+                    at_front = self._waiting[0] == ticket
+
+                wait = self.bucket.take(RESERVE[level]) if at_front else None
+                if wait == 0:
+                    self._record(level, "acquired", queued, start)
+                    return True
+
+                queued = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._record(level, "throttled", queued, start)
+                    return False
+                time.sleep(min(wait, remaining))
+        finally:
+            with self._cond:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    # asyncio version of acquire for the async TMDB client - waits with asyncio.sleep instead of a thread,
+    # so a worker can have any number of calls waiting; it asks the bucket itself unless a caller
+    # of a higher priority is queued in acquire
+    async def acquire_async(self, level=None, timeout=None):
+        level = current_priority() if level is None else level
+        start = time.monotonic()
+        deadline = start + (self.timeout if timeout is None else timeout)
+        queued = False
+        while True:
+            with self._cond:
+                blocked = bool(self._waiting) and self._waiting[0][0] < level
+            wait = 1 / self.bucket.rate if blocked else self.bucket.take(RESERVE[level])
+            if wait == 0:
+                self._record(level, "acquired", queued, start)
+                return True
+
+            queued = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record(level, "throttled", queued, start)
+                return False
+            await asyncio.sleep(min(wait, remaining))
+
+    # Per-priority counts: acquired, queued (had to wait), throttled (gave up) and total wait
+    def stats(self):
+        with self._cond:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+            stats["waiting"] = len(self._waiting)
+        return stats
+
+
+# A named bucket - shared between workers when TMDB_RATE_URL (defaults to TMDB_CACHE_URL) is SQLite or Redis,
+# otherwise local to this process
+def bucket_from_env(rate, burst, name="tmdb"):
+    url = os.getenv('TMDB_RATE_URL', os.getenv('TMDB_CACHE_URL', ''))
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisTokenBucket(url, rate, burst, name)
+    if url.startswith("sqlite:///"):
+        return SQLiteTokenBucket(url[len("sqlite:///"):], rate, burst, name)
+    return TokenBucket(rate, burst)
+
+# Build the TMDB limiter from environment variables
+def limiter_from_env():
+    rate = float(os.getenv('TMDB_RATE_LIMIT', 40))
+    burst = float(os.getenv('TMDB_RATE_BURST', 40))
+    bucket = bucket_from_env(rate, burst)
+
+    return RateLimiter(bucket,
+                       max_queue=int(os.getenv('TMDB_RATE_QUEUE', 100)),
+                       timeout=float(os.getenv('TMDB_RATE_TIMEOUT', 5)))
@@ -0,0 +1,153 @@
+# In-memory recommendation engine
+# Loads the local catalog into NumPy arrays once and scores every movie against the quiz answers in one pass
+import os
+import threading
+import time
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, CatalogMovie
+from app.catalog import catalog_enabled
+from app.records import Movie
+
+# The preferred sort column adds at most this much to a movie's score, so genre matches always decide first
+SORT_WEIGHT = 0.5
+
+# Ignore movies with hardly any votes - their ratings are mostly noise
+MIN_VOTES = 20
+
+# Reload the catalog this often so a sync run in another process gets picked up
+RELOAD_SECONDS = int(os.getenv('RECOMMENDER_RELOAD_SECONDS', 3600))
+EMPTY_RETRY_SECONDS = 60
+
+_engine = None
+_loaded_at = float('-inf')
+_engine_lock = threading.Lock()
+
+
+# Rank of each value scaled to 0..1 (0 = smallest)
+def _rank(values):
+    if len(values) < 2:
+        return np.zeros(len(values), dtype=np.float32)
+    return (np.argsort(np.argsort(values, kind='stable'), kind='stable') / (len(values) - 1)).astype(np.float32)
+
+
+class RecommendationEngine:
+    def __init__(self, rows):
+        # rows are (id, title, overview, genre_ids, runtime, release_date, release_year,
+        #            vote_average, vote_count, popularity, poster_path) tuples
+        self.movies = []
+        genre_lists = []
+        for row in rows:
+            genre_ids = [int(genre_id) for genre_id in row[3].strip(',').split(',') if genre_id]
+            genre_lists.append(genre_ids)
+            self.movies.append(Movie(row[0], row[1], row[2] or '', row[10], row[5] or '',
+                                     row[7], row[8], row[9], tuple(genre_ids)))
+
+        # Genre multi-hot matrix: one row per movie, one column per genre
+        self.genre_index = {genre_id: column for column, genre_id in
+                            enumerate(sorted({genre_id for genres in genre_lists for genre_id in genres}))}
+        self.genres = np.zeros((len(rows), len(self.genre_index)), dtype=np.float32)
+        for i, genres in enumerate(genre_lists):
+            for genre_id in genres:
+                self.genres[i, self.genre_index[genre_id]] = 1
+
+        # Numeric columns - unknown runtime/year are NaN so range filters never match them
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.runtime = np.array([row[4] if row[4] else np.nan for row in rows], dtype=np.float32)
+        self.year = np.array([row[6] if row[6] else np.nan for row in rows], dtype=np.float32)
+        self.rating = np.array([row[7] for row in rows], dtype=np.float32)
+        self.vote_count = np.array([row[8] for row in rows], dtype=np.float32)
+        self.popularity = np.array([row[9] for row in rows], dtype=np.float32)
+
+        # Bonus for each quiz sort option, precomputed once
+        self.sort_bonus = {
+            'popularity.desc': SORT_WEIGHT * _rank(self.popularity),
+            'vote_average.desc': SORT_WEIGHT * _rank(self.rating),
+            'vote_count.asc': SORT_WEIGHT * (1 - _rank(self.vote_count))
+        }
+
+    def __len__(self):
+        return len(self.movies)
+
+    # Top-k movies for a set of genre weights and quiz filters, skipping ids in exclude
+    def recommend(self, genre_scores, min_year=None, max_year=None, min_runtime=None, max_runtime=None,
+                  min_rating=None, sort_by='popularity.desc', exclude=(), k=8, offset=0, **_):
+        weights = np.zeros(len(self.genre_index), dtype=np.float32)
+        for genre_id, weight in genre_scores.items():
+            column = self.genre_index.get(int(genre_id))
+            if column is not None:
+                weights[column] = weight
+
+        genre_score = self.genres @ weights
+        scores = genre_score + self.sort_bonus.get(sort_by, self.sort_bonus['popularity.desc'])
+
+        # Filters as boolean masks
+        mask = self.vote_count >= MIN_VOTES
+        if weights.any():
+            mask &= genre_score > 0
+        if min_year:
+            mask &= self.year >= min_year
+        if max_year:
+            mask &= self.year <= max_year
+        if min_runtime:
+            mask &= self.runtime >= min_runtime
+        if max_runtime:
+            mask &= self.runtime <= max_runtime
+        if min_rating:
+            mask &= self.rating >= min_rating
+        if exclude:
+            mask &= ~np.isin(self.ids, np.fromiter(exclude, dtype=np.int64, count=len(exclude)))
+
+        candidates = np.flatnonzero(mask)
+        wanted = offset + k
+        if len(candidates) > wanted:
+            candidates = candidates[np.argpartition(-scores[candidates], wanted - 1)[:wanted]]
+
+        # Best score first, ties broken by id so results are stable
+        top = candidates[np.lexsort((self.ids[candidates], -scores[candidates]))]
+        return [self.movies[i] for i in top[offset:wanted]]
+
+
+# Read the catalog columns straight into an engine (no ORM objects)
+def load_engine():
+    rows = db.session.query(CatalogMovie.id, CatalogMovie.title, CatalogMovie.overview, CatalogMovie.genre_ids,
+                            CatalogMovie.runtime, CatalogMovie.release_date, CatalogMovie.release_year,
+                            CatalogMovie.vote_average, CatalogMovie.vote_count, CatalogMovie.popularity,
+                            CatalogMovie.poster_path).all()
+    return RecommendationEngine(rows)
+
+def _needs_reload():
+    age = time.monotonic() - _loaded_at
+    return age > (RELOAD_SECONDS if _engine is not None else EMPTY_RETRY_SECONDS)
+
+# Engine shared by every request in this process - loaded on first use, None while the catalog is empty
+def get_engine():
+    global _engine, _loaded_at
+    if _needs_reload():
+        with _engine_lock:
+            if _needs_reload():
+                engine = load_engine()
+                _engine = engine if len(engine) else None
+                _loaded_at = time.monotonic()
+    return _engine
+
+# Forget the loaded engine so the next request reloads it (call after a catalog sync)
+def reset_engine():
+    global _engine, _loaded_at
+    with _engine_lock:
+        _engine = None
+        _loaded_at = float('-inf')
+
+# Recommendations for quiz results - [] if the catalog is turned off, not synced yet or not loaded,
+# so callers fall back to TMDB
+def recommend(genre_scores, preferences, exclude=(), k=8, offset=0):
+    try:
+        if not catalog_enabled():
+            return []
+        engine = get_engine()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return []
+    if engine is None:
+        return []
+    return engine.recommend(genre_scores, exclude=exclude, k=k, offset=offset, **preferences)
@@ -0,0 +1,114 @@
+# Compact movie records
+# TMDB responses are projected down to the fields the templates use before they are cached,
+# stored as plain tuples (cheap to keep in memory and to serialize) and turned back into records on read
+from dataclasses import dataclass, fields
+
+# Top-billed cast members kept from the credits
+CAST_LIMIT = 10
+
+
+# Lets records be used like the TMDB dicts they replace: movie['id'], movie.get('title')
+class _RecordAccess:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_tuple(self):
+        return tuple(getattr(self, field.name) for field in fields(self))
+
+    @classmethod
+    def from_tuple(cls, values):
+        return cls(*values)
+
+    def to_dict(self):
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+# A movie in a list (popular, discover, search, catalog)
+@dataclass(slots=True)
+class Movie(_RecordAccess):
+    id: int
+    title: str
+    overview: str
+    poster_path: str
+    release_date: str
+    vote_average: float
+    vote_count: int
+    popularity: float
+    genre_ids: tuple
+
+    @classmethod
+    def from_tmdb(cls, data):
+        return cls(
+            data['id'],
+            data.get('title') or '',
+            data.get('overview') or '',
+            data.get('poster_path'),
+            data.get('release_date') or '',
+            data.get('vote_average') or 0,
+            data.get('vote_count') or 0,
+            data.get('popularity') or 0,
+            tuple(data.get('genre_ids') or ())
+        )
+
+
+# A single movie page - only top-billed cast and YouTube trailers are kept
+@dataclass(slots=True)
+class MovieDetails(_RecordAccess):
+    id: int
+    title: str
+    tagline: str
+    overview: str
+    poster_path: str
+    release_date: str
+    runtime: int
+    vote_average: float
+    genres: tuple
+    cast: tuple
+    trailers: tuple
+
+    @classmethod
+    def from_tmdb(cls, data):
+        cast = (data.get('credits') or {}).get('cast') or []
+        videos = (data.get('videos') or {}).get('results') or []
+        return cls(
+            data['id'],
+            data.get('title') or '',
+            data.get('tagline') or '',
+            data.get('overview') or '',
+            data.get('poster_path'),
+            data.get('release_date') or '',
+            data.get('runtime'),
+            data.get('vote_average') or 0,
+            tuple({'id': genre['id'], 'name': genre['name']} for genre in data.get('genres') or ()),
+            tuple({'name': actor.get('name'), 'character': actor.get('character')} for actor in cast[:CAST_LIMIT]),
+            tuple({'key': video['key'], 'name': video.get('name')} for video in videos
+                  if video.get('type') == 'Trailer' and video.get('site') == 'YouTube')
+        )
+
+    @classmethod
+    def from_tuple(cls, values):
+        record = cls(*values)
+        # JSON (shared cache tier) turns the nested tuples into lists
+        record.genres = tuple(record.genres)
+        record.cast = tuple(record.cast)
+        record.trailers = tuple(record.trailers)
+        return record
+
+
+# Projections applied before caching - list pages become a list of Movie tuples
+def project_movie_list(data, key="results"):
+    return [Movie.from_tmdb(movie).to_tuple() for movie in data.get(key) or []]
+
+def project_movie_details(data):
+    return MovieDetails.from_tmdb(data).to_tuple()
+
+def movies_from_cache(values):
+    return [Movie.from_tuple(value) for value in values]
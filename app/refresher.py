@@ -0,0 +1,133 @@
+# Background refresh-ahead for hot TMDB cache entries, plus pre-warming at startup
+# Keys read often (see HotKeys in app/cache.py) are refetched once REFRESH_AHEAD of their TTL has passed,
+# so popular lists never expire under a user; every TMDB call made here comes out of a per-minute budget
+# (shared by all workers through the same SQLite/Redis store as the rate limiter, if one is configured)
+import logging
+import os
+import threading
+import time
+from app.rate_limit import PREFETCH, bucket_from_env, priority
+from app.tmdb_api import refresh_entry, is_cached, due_for_refresh, popular_request, discover_request
+from app.quiz import tmdb_result_preferences
+
+# TMDB calls per minute the refresher may spend (pre-warming included)
+REFRESH_BUDGET = float(os.getenv('TMDB_REFRESH_BUDGET', 60))
+
+# Refetch once this share of an entry's TTL has passed
+REFRESH_AHEAD = float(os.getenv('TMDB_REFRESH_AHEAD', 0.8))
+
+# Decayed reads (half-life TMDB_HOT_HALF_LIFE seconds) a key needs before it is kept warm
+MIN_SCORE = float(os.getenv('TMDB_REFRESH_MIN_SCORE', 3))
+
+TICK_SECONDS = 5
+
+# A key whose refetch failed waits this long before the next try, doubling per failure up to MAX_BACKOFF
+RETRY_SECONDS = 30
+MAX_BACKOFF = 900
+
+# Warmed at startup: popular pages 1-5 and the likeliest quiz results
+PREWARM_PAGES = range(1, 6)
+PREWARM_PROFILES = int(os.getenv('TMDB_PREWARM_PROFILES', 50))
+
+_refresher = None
+
+logger = logging.getLogger(__name__)
+
+
+class Refresher:
+    def __init__(self, budget_per_minute=REFRESH_BUDGET):
+        self.budget = bucket_from_env(budget_per_minute / 60, budget_per_minute, name="tmdb-refresh")
+        self.stats = {"prewarmed": 0, "refreshed": 0, "failed": 0, "skipped": 0, "backing_off": 0}
+        # key -> (failures in a row, monotonic time of the next try)
+        self._failures = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fetch(self, request, outcome):
+        ok = refresh_entry(*request)
+        self.stats[outcome if ok else "failed"] += 1
+        return ok
+
+    # Entries to fill at startup: the discover pages /results would read from TMDB for the likeliest
+    # profiles (the same list QUIZ_PREWARM uses) - needs an app context
+    def prewarm_requests(self, profiles=PREWARM_PROFILES):
+        requests = [popular_request(page) for page in PREWARM_PAGES]
+        for preferences in tmdb_result_preferences(profiles):
+            requests.append(discover_request(**preferences._asdict(), page=1))
+        return requests
+
+    # Fill missing entries, waiting for budget between calls
+    def prewarm(self):
+        for request in self.prewarm_requests():
+            if is_cached(request[0], request[1]):
+                self.stats["skipped"] += 1
+                continue
+            wait = self.budget.take()
+            while wait:
+                if self._stop.wait(wait):
+                    return
+                wait = self.budget.take()
+            self._fetch(request, "prewarmed")
+
+    # Refetch hot entries that are about to expire, as far as this minute's budget goes
+    # Keys that keep failing back off instead of using up the budget every tick
+    def refresh_due(self):
+        due = due_for_refresh(REFRESH_AHEAD, MIN_SCORE)
+        # Keys no longer due (refetched by a page load, or gone cold) start afresh
+        due_keys = {key for key, _ in due}
+        self._failures = {key: failure for key, failure in self._failures.items() if key in due_keys}
+        now = time.monotonic()
+        for key, request in due:
+            failures, retry_at = self._failures.get(key, (0, 0))
+            if retry_at > now:
+                self.stats["backing_off"] += 1
+                continue
+            if self.budget.take():
+                break
+            if self._fetch(request, "refreshed"):
+                self._failures.pop(key, None)
+            else:
+                delay = min(MAX_BACKOFF, RETRY_SECONDS * 2 ** failures)
+                self._failures[key] = (failures + 1, time.monotonic() + delay)
+
+    # Page loads get TMDB first - refresh traffic only uses rate-limit headroom
+    def run(self):
+        with priority(PREFETCH):
+            while not self._stop.wait(TICK_SECONDS):
+                try:
+                    self.refresh_due()
+                except Exception:
+                    logger.exception("Background refresh failed")
+
+    def run_prewarm(self, app):
+        with app.app_context(), priority(PREFETCH):
+            try:
+                self.prewarm()
+            except Exception:
+                logger.exception("Pre-warming failed")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="tmdb-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def start_prewarm(self, app):
+        threading.Thread(target=self.run_prewarm, args=(app,), name="tmdb-prewarm", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# Start the process-wide refresher once - every worker runs one for the keys its own requests read
+def start_refresher(budget_per_minute=REFRESH_BUDGET):
+    global _refresher
+    if _refresher is None:
+        _refresher = Refresher(budget_per_minute).start()
+    return _refresher
+
+# Fill the startup entries - only needed once for all workers (see the lease in app/factory.py)
+def start_prewarm(app, budget_per_minute=REFRESH_BUDGET):
+    start_refresher(budget_per_minute).start_prewarm(app)
+
+def get_refresher_stats():
+    return dict(_refresher.stats) if _refresher is not None else None
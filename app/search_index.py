@@ -0,0 +1,150 @@
+# Local title search over the catalog
+# Trigram inverted index for typo-tolerant matching plus a sorted word list for prefix (autocomplete) matches
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, CatalogMovie
+from app.records import Movie
+
+# Titles need at least this much trigram similarity to count as a match
+MIN_SIMILARITY = 0.3
+
+# Extra similarity for titles containing a word that starts with the last query word
+PREFIX_BONUS = 0.3
+
+# Similarity /search needs to answer from the index alone - below it TMDB is asked as well
+CLOSE_SIMILARITY = 0.6
+
+RELOAD_SECONDS = int(os.getenv('SEARCH_INDEX_RELOAD_SECONDS', 3600))
+EMPTY_RETRY_SECONDS = 60
+
+_index = None
+_loaded_at = float('-inf')
+_index_lock = threading.Lock()
+
+
+# Lowercase, strip accents and punctuation: "Amélie!" -> "amelie"
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+# Trigrams of each word padded like pg_trgm: "cat" -> "  c", " ca", "cat", "at "
+def trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class SearchIndex:
+    def __init__(self, movies):
+        self.movies = movies
+        self.gram_counts = []
+        self.postings = defaultdict(list)
+        words = []
+        for i, movie in enumerate(movies):
+            title = normalize(movie['title'])
+            grams = trigrams(title)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(i)
+            for word in set(title.split()):
+                words.append((word, i))
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_movies = [i for _, i in words]
+
+    def __len__(self):
+        return len(self.movies)
+
+    # Movies with a word starting with prefix
+    def _prefix_matches(self, prefix):
+        matches = set()
+        start = bisect_left(self.words, prefix)
+        for position in range(start, len(self.words)):
+            if not self.words[position].startswith(prefix):
+                break
+            matches.add(self.word_movies[position])
+        return matches
+
+    # Best matches for a query, ranked by similarity and then popularity
+    def search(self, query, limit=20, min_similarity=MIN_SIMILARITY):
+        query = normalize(query)
+        if not query:
+            return []
+
+        query_grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for i in self.postings.get(gram, ()):
+                shared[i] += 1
+        prefix_matches = self._prefix_matches(query.split()[-1])
+
+        scored = []
+        for i in set(shared) | prefix_matches:
+            # Dice coefficient over trigram sets
+            similarity = 2 * shared.get(i, 0) / (len(query_grams) + self.gram_counts[i])
+            if i in prefix_matches:
+                similarity += PREFIX_BONUS
+            if similarity >= min_similarity:
+                popularity = self.movies[i]['popularity'] or 0
+                scored.append((similarity * (1 + 0.1 * math.log1p(popularity)), i))
+
+        scored.sort(key=lambda item: (-item[0], self.movies[item[1]]['id']))
+        return [self.movies[i] for _, i in scored[:limit]]
+
+
+# Build the index from catalog columns (no ORM objects)
+def load_index():
+    rows = db.session.query(CatalogMovie.id, CatalogMovie.title, CatalogMovie.overview, CatalogMovie.release_date,
+                            CatalogMovie.vote_average, CatalogMovie.vote_count, CatalogMovie.popularity,
+                            CatalogMovie.poster_path).all()
+    movies = [Movie(row[0], row[1], row[2] or '', row[7], row[3] or '', row[4], row[5], row[6], ())
+              for row in rows]
+    return SearchIndex(movies)
+
+def _needs_reload():
+    age = time.monotonic() - _loaded_at
+    return age > (RELOAD_SECONDS if _index is not None else EMPTY_RETRY_SECONDS)
+
+# Index shared by every request in this process - None while the catalog is empty
+def get_index():
+    global _index, _loaded_at
+    if _needs_reload():
+        with _index_lock:
+            if _needs_reload():
+                index = load_index()
+                _index = index if len(index) else None
+                _loaded_at = time.monotonic()
+    return _index
+
+# Forget the loaded index so the next search rebuilds it (call after a catalog sync)
+def reset_index():
+    global _index, _loaded_at
+    with _index_lock:
+        _index = None
+        _loaded_at = float('-inf')
+
+# Search the local index - [] if it has no match or isn't available, so callers can fall back to TMDB
+def search_local(query, limit=20, min_similarity=MIN_SIMILARITY):
+    try:
+        index = get_index()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return []
+    if index is None:
+        return []
+    return index.search(query, limit, min_similarity)
+
+# TMDB results followed by the local matches they don't include - for queries the index has no close match for
+def merge_results(remote, local, limit=20):
+    remote_ids = {movie['id'] for movie in remote}
+    return (list(remote) + [movie for movie in local if movie['id'] not in remote_ids])[:limit]
@@ -0,0 +1,126 @@
+// Infinite scroll for the results page
+// When the end of the list comes into view, more recommendations are read from /api/recommendations
+// as NDJSON and each batch is added as soon as its line arrives; the cursor in the line says where to continue
+(function () {
+    const more = document.getElementById('results-more');
+    const list = document.getElementById('results-list');
+    if (!more || !list || !more.dataset.cursor || !window.fetch || !window.IntersectionObserver) {
+        return;
+    }
+
+    let cursor = more.dataset.cursor;
+    let loading = false;
+    // The scroll replaces the "More Movies" reload link
+    more.textContent = '';
+
+    // Same markup as the cards results.html renders
+    function card(movie) {
+        const element = document.createElement('div');
+        element.className = 'movie-card';
+        const link = document.createElement('a');
+        link.href = '/movie/' + movie.id;
+        link.className = 'movie-card-link';
+
+        const poster = document.createElement('img');
+        poster.src = movie.poster;
+        poster.alt = movie.title;
+        poster.className = 'movie-poster';
+        poster.loading = 'lazy';
+
+        const info = document.createElement('div');
+        info.className = 'movie-info';
+        const title = document.createElement('h3');
+        title.textContent = movie.title;
+        const overview = document.createElement('p');
+        overview.textContent = movie.overview + '...';
+        const rating = document.createElement('p');
+        const label = document.createElement('strong');
+        label.textContent = 'Rating:';
+        rating.append(label, ' ' + movie.rating + '/10');
+
+        info.append(title, overview, rating);
+        link.append(poster, info);
+        element.append(link);
+        return element;
+    }
+
+    function addBatch(line) {
+        if (!line.trim()) {
+            return;
+        }
+        const batch = JSON.parse(line);
+        batch.movies.forEach(function (movie) {
+            list.appendChild(card(movie));
+        });
+        cursor = batch.cursor;
+        if (batch.retry) {
+            // TMDB failed part way - the cursor continues from there once the user retries
+            throw new Error('Feed interrupted, retry later');
+        }
+    }
+
+    function retryButton() {
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'btn btn--accent btn--small';
+        button.textContent = 'Load More';
+        button.addEventListener('click', function () {
+            more.textContent = '';
+            observer.observe(more);
+        });
+        return button;
+    }
+
+    async function load() {
+        if (loading || !cursor) {
+            return;
+        }
+        loading = true;
+        try {
+            const response = await fetch(more.dataset.feed + '?cursor=' + encodeURIComponent(cursor), {
+                headers: { Accept: 'application/x-ndjson' },
+                credentials: 'same-origin'
+            });
+            if (!response.ok) {
+                throw new Error('Feed request failed: ' + response.status);
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            for (;;) {
+                const { done, value } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                lines.forEach(addBatch);
+            }
+            addBatch(buffered + decoder.decode());
+        } catch (error) {
+            // Keep the cursor and wait for the user rather than retrying in a loop
+            console.error(error);
+            observer.unobserve(more);
+            more.appendChild(retryButton());
+            return;
+        } finally {
+            loading = false;
+        }
+
+        if (!cursor) {
+            observer.disconnect();
+        } else {
+            // Observing again reports straight away if the end of the list is still on screen
+            observer.unobserve(more);
+            observer.observe(more);
+        }
+    }
+
+    const observer = new IntersectionObserver(function (entries) {
+        if (entries.some(function (entry) { return entry.isIntersecting; })) {
+            load();
+        }
+    }, { rootMargin: '600px 0px' });
+    observer.observe(more);
+})();
@@ -1,56 +1,305 @@
 # TMDB API functions for getting movie data
 import os
+import re
+import threading
+import contextvars
+import itertools
+import time
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from dotenv import load_dotenv
-
-load_dotenv()
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlencode
+from app.cache import cache_from_env, SingleFlight, HotKeys
+from app.rate_limit import limiter_from_env
+from app.records import MovieDetails, project_movie_list, project_movie_details, movies_from_cache
+from app.instrumentation import record_tmdb
 
 # Get API key from environment variables
 API_KEY = os.getenv('TMDB_API_KEY')
-BASE_URL = "https://api.themoviedb.org/3"
+BASE_URL = os.getenv('TMDB_BASE_URL', "https://api.themoviedb.org/3")
+
+# HTTP client settings - override in .env (e.g. point TMDB_BASE_URL at a local stub server)
+CONNECT_TIMEOUT = float(os.getenv('TMDB_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('TMDB_READ_TIMEOUT', 10))
+MAX_RETRIES = int(os.getenv('TMDB_MAX_RETRIES', 3))
+RETRY_BACKOFF = float(os.getenv('TMDB_RETRY_BACKOFF', 0.5))
+POOL_SIZE = int(os.getenv('TMDB_POOL_SIZE', 20))
+
+# How long each kind of response stays cached (seconds)
+LIST_TTL = int(os.getenv('TMDB_LIST_TTL', 3600))
+DETAILS_TTL = int(os.getenv('TMDB_DETAILS_TTL', 3600))
+SEARCH_TTL = int(os.getenv('TMDB_SEARCH_TTL', 600))
+
+_cache = cache_from_env()
+
+# Every TMDB request waits for a token here (see app/rate_limit.py for priorities)
+_limiter = limiter_from_env()
+
+# Identical concurrent fetches share one TMDB request - within a process via _flights,
+# across workers via a lock in the shared cache tier
+_flights = SingleFlight()
+
+# Read counts per cache key for the background refresher (app/refresher.py)
+_hot_keys = HotKeys(half_life=int(os.getenv('TMDB_HOT_HALF_LIFE', 300)))
+FLIGHT_LOCK_TTL = READ_TIMEOUT * (MAX_RETRIES + 1)
+FLIGHT_POLL_INTERVAL = 0.05
+
+# Threads used to fetch several result pages at the same time
+PREFETCH_WORKERS = int(os.getenv('TMDB_PREFETCH_WORKERS', 10))
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="tmdb-prefetch")
+
+# Most pages one call keeps in flight (TMDB_PAGES_AHEAD); unset, an eighth of the rate-limit burst,
+# so one page load can't drain the bucket every other request draws from
+PAGES_AHEAD = int(os.getenv('TMDB_PAGES_AHEAD', 0)) or None
+
+# Optional local source tried before TMDB discover (see app/catalog.py)
+_local_source = None
+
+_session = None
+_session_lock = threading.Lock()
+
+# Per-endpoint call counters: calls, errors and total/max latency in ms
+_call_stats = {}
+_stats_lock = threading.Lock()
+
+# Build a session that keeps connections alive and retries 429/5xx with backoff
+def _build_session():
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Shared session used by every TMDB call in this process
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+# Drop the shared session (e.g. after fork or when settings change)
+def reset_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def _record_call(endpoint, elapsed_ms, ok, status=None, size=0):
+    # Group /movie/123 and /find/tt123 style paths under one counter
+    endpoint = re.sub(r"/(tt)?\d+", "/{id}", endpoint)
+    record_tmdb(endpoint, status, size, elapsed_ms)
+    with _stats_lock:
+        stats = _call_stats.setdefault(endpoint, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        if not ok:
+            stats["errors"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+# Copy of the latency counters with the average filled in
+def get_call_stats():
+    with _stats_lock:
+        snapshot = {endpoint: dict(stats) for endpoint, stats in _call_stats.items()}
+    for stats in snapshot.values():
+        stats["avg_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+    return snapshot
+
+# Throttled/queued counts per priority class
+def get_rate_limit_stats():
+    return _limiter.stats()
+
+def reset_call_stats():
+    with _stats_lock:
+        _call_stats.clear()
+
+# Send a GET to TMDB and return the decoded JSON, or None on any failure
+def _get(endpoint, params=None):
+    query = {"api_key": API_KEY, "language": "en-US"}
+    if params:
+        query.update(params)
+
+    # Out of quota - give up instead of getting a 429 from TMDB
+    if not _limiter.acquire():
+        _record_call(endpoint, 0.0, False, "throttled")
+        return None
+
+    start = time.perf_counter()
+    ok = False
+    status = None
+    size = 0
+    try:
+        response = get_session().get(f"{BASE_URL}{endpoint}", params=query,
+                                     timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        status = response.status_code
+        size = len(response.content)
+        if response.status_code == 200:
+            ok = True
+            return response.json()
+        return None
+    except (requests.RequestException, ValueError):
+        return None
+    finally:
+        _record_call(endpoint, (time.perf_counter() - start) * 1000, ok, status, size)
+
+# Bump when the shape of cached values changes so old shared-tier entries are ignored
+CACHE_VERSION = "v2"
+
+# Cache key from the endpoint and sorted params (API key and language are always the same)
+def _cache_key(endpoint, params):
+    items = sorted((key, str(value)) for key, value in (params or {}).items() if value is not None)
+    return f"{CACHE_VERSION}:{endpoint}?{urlencode(items)}"
+
+# Same as _get but answered from the cache when possible - only successful responses are stored
+# project trims the response (see app/records.py) before it is cached
+def _cached_get(endpoint, params=None, ttl=LIST_TTL, project=None):
+    key = _cache_key(endpoint, params)
+    _hot_keys.touch(key, (endpoint, params, ttl, project))
+    data = _cache.get(key)
+    if data is not None:
+        return data
+    return _flights.do(key, lambda: _fetch_once(key, endpoint, params, ttl, project))
+
+def _fetch_and_store(key, endpoint, params, ttl, project=None):
+    data = _get(endpoint, params)
+    if data is not None:
+        if project is not None:
+            data = project(data)
+        _cache.set(key, data, ttl)
+        _hot_keys.stored(key, ttl)
+    return data
+
+# Fetch a missing entry, unless another worker already is - then wait for its result in the shared cache
+def _fetch_once(key, endpoint, params, ttl, project):
+    deadline = time.monotonic() + FLIGHT_LOCK_TTL
+    while True:
+        token = _cache.acquire_lock(key, FLIGHT_LOCK_TTL)
+        if token:
+            try:
+                # The previous lock holder may have stored it just before releasing
+                data = _cache.peek(key)
+                if data is None:
+                    data = _fetch_and_store(key, endpoint, params, ttl, project)
+                return data
+            finally:
+                _cache.release_lock(key, token)
+
+        # The other worker is taking too long - fetch it ourselves
+        if time.monotonic() > deadline:
+            return _fetch_and_store(key, endpoint, params, ttl, project)
+
+        # Polling peeks, so the wait doesn't show up as a run of cache misses
+        time.sleep(FLIGHT_POLL_INTERVAL)
+        data = _cache.peek(key)
+        if data is not None:
+            return data
+
+# Hit/miss/eviction counters for both cache tiers
+def get_cache_stats():
+    stats = _cache.stats()
+    stats["coalesced"] = _flights.shared
+    return stats
+
+def clear_cache():
+    _cache.clear()
+
+# Cross-worker lease in the shared cache tier (for background jobs) - a token, or None while another worker has it
+# Without a shared tier every process gets it
+def acquire_lease(name, ttl):
+    return _cache.acquire_lock("lease:" + name, ttl)
+
+# Keep a lease for another ttl seconds - False once it has been lost
+def renew_lease(name, token, ttl):
+    return _cache.extend_lock("lease:" + name, token, ttl)
+
+# Register a function that answers get_movies_with_filters from local data
+# It gets the same keyword arguments and returns a list of movies ([] means fall back to TMDB)
+def set_local_source(source):
+    global _local_source
+    _local_source = source
+
+# Fetch and store an entry now without reading the cache first (background refresh) - True if it worked
+# Every worker refreshes the keys it reads, so the cross-worker lock keeps two from fetching one at the same time
+def refresh_entry(endpoint, params, ttl=LIST_TTL, project=None):
+    key = _cache_key(endpoint, params)
+    token = _cache.acquire_lock(key, FLIGHT_LOCK_TTL)
+    if not token:
+        # Another worker is fetching it right now
+        return True
+    try:
+        return _flights.do(key, lambda: _fetch_and_store(key, endpoint, params, ttl, project)) is not None
+    finally:
+        _cache.release_lock(key, token)
+
+def is_cached(endpoint, params):
+    return _cache.get(_cache_key(endpoint, params)) is not None
+
+# Hot entries that are close to expiring, as (key, (endpoint, params, ttl, project)) - hottest first
+# Read counts are per worker, so each worker refreshes its own hot keys; one another worker has already
+# refreshed only gets its age here caught up from the shared tier, instead of being fetched again
+def due_for_refresh(ahead, min_score):
+    due = []
+    for key, request in _hot_keys.due(ahead, min_score):
+        ttl = request[2]
+        left = _cache.ttl_left(key)
+        if left > ttl * (1 - ahead):
+            _hot_keys.stored(key, ttl, age=ttl - left)
+            continue
+        due.append((key, request))
+    return due
+
+# (endpoint, params, ttl, project) behind the cached list fetchers, so the refresher can warm the same keys
+def popular_request(page=1):
+    return "/movie/popular", {"page": page}, LIST_TTL, project_movie_list
+
+def discover_request(**filters):
+    return "/discover/movie", discover_params(**filters), LIST_TTL, project_movie_list
 
 # Get popular movies from TMDB
 def get_popular_movies(page=1):
-    url = f"{BASE_URL}/movie/popular"
-    params = {
-        "api_key": API_KEY,
-        "language": "en-US",
-        "page": page
-    }
-    
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()["results"]
+    data = _cached_get(*popular_request(page))
+    if data:
+        return movies_from_cache(data)
     return []
 
 # Get movies by specific genre
 def get_movies_by_genre(genre_id):
-    url = f"{BASE_URL}/discover/movie"
     params = {
-        "api_key": API_KEY,
-        "language": "en-US",
         "with_genres": genre_id,
         "sort_by": "popularity.desc",
         "page": 1
     }
-    
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()["results"][:8]
+
+    data = _cached_get("/discover/movie", params, project=project_movie_list)
+    if data:
+        return movies_from_cache(data[:8])
     return []
 
-# Get movies with multiple filters based on quiz preferences
-def get_movies_with_filters(genres=None, min_year=None, max_year=None, 
-                           min_runtime=None, max_runtime=None, 
-                           min_rating=None, sort_by="popularity.desc", page=1):
-    url = f"{BASE_URL}/discover/movie"
+# Discover query params for the quiz filters
+def discover_params(genres=None, min_year=None, max_year=None,
+                    min_runtime=None, max_runtime=None,
+                    min_rating=None, sort_by="popularity.desc", page=1):
     params = {
-        "api_key": API_KEY,
-        "language": "en-US",
         "page": page,
         "sort_by": sort_by
     }
-    
+
     # Add filters if provided
     if genres:
         params["with_genres"] = ",".join(map(str, genres))
@@ -64,37 +313,129 @@ def get_movies_with_filters(genres=None, min_year=None, max_year=None,
         params["with_runtime.lte"] = max_runtime
     if min_rating:
         params["vote_average.gte"] = min_rating
-    
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()["results"][:8]
-    return []
+    return params
+
+# Movies from the registered local source, or [] when there is none or it has no match
+def local_movies(**filters):
+    if _local_source is None:
+        return []
+    return _local_source(**filters)[:8]
+
+# Get movies with multiple filters based on quiz preferences
+def get_movies_with_filters(genres=None, min_year=None, max_year=None,
+                           min_runtime=None, max_runtime=None,
+                           min_rating=None, sort_by="popularity.desc", page=1):
+    filters = dict(genres=genres, min_year=min_year, max_year=max_year,
+                   min_runtime=min_runtime, max_runtime=max_runtime,
+                   min_rating=min_rating, sort_by=sort_by, page=page)
+    return discover_page(**filters) or []
+
+# Same as get_movies_with_filters, but None when TMDB couldn't be asked (an error, or out of quota) -
+# for callers that have to tell a failed page from the end of the results
+def discover_page(**filters):
+    movies = local_movies(**filters)
+    if movies:
+        return movies
+
+    data = _cached_get(*discover_request(**filters))
+    if data is None:
+        return None
+    return movies_from_cache(data[:8])
+
+# Get cast and trailers with the details
+DETAILS_PARAMS = {
+    "append_to_response": "credits,videos"
+}
 
 # Get detailed info for a specific movie
 def get_movie_details(movie_id):
-    url = f"{BASE_URL}/movie/{movie_id}"
-    params = {
-        "api_key": API_KEY,
-        "language": "en-US",
-        "append_to_response": "credits,videos,similar"  # Get cast, trailers, and similar movies
-    }
-    
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
+    data = _cached_get(f"/movie/{movie_id}", DETAILS_PARAMS, ttl=DETAILS_TTL, project=project_movie_details)
+    if data:
+        return MovieDetails.from_tuple(data)
+    return None
+
+# Full raw result page from a list endpoint, not cached - used by the catalog sync job
+def get_movie_list(endpoint, page=1, **params):
+    data = _get(endpoint, {"page": page, **params})
+    if data:
+        return data["results"]
+    return []
+
+def discover_movies(page=1, sort_by="popularity.desc"):
+    return get_movie_list("/discover/movie", page, sort_by=sort_by)
+
+# Basic movie info without credits/videos, not cached - used by the catalog sync job
+def get_movie(movie_id):
+    return _get(f"/movie/{movie_id}")
+
+# Look up a movie by its IMDb id (tt0133093) - used when importing IMDb exports
+def find_by_imdb_id(imdb_id):
+    data = _cached_get(f"/find/{imdb_id}", {"external_source": "imdb_id"}, ttl=DETAILS_TTL,
+                       project=lambda found: project_movie_list(found, "movie_results"))
+    if data:
+        return movies_from_cache(data)[0]
     return None
 
 # Search for movies by title
 def search_movies(query, page=1):
-    url = f"{BASE_URL}/search/movie"
     params = {
-        "api_key": API_KEY,
-        "language": "en-US",
         "query": query,
         "page": page
     }
-    
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()["results"]
+
+    data = _cached_get("/search/movie", params, ttl=SEARCH_TTL, project=project_movie_list)
+    if data:
+        return movies_from_cache(data)
     return []
+
+# How many pages to keep in flight: `ahead` if given, else the whole request up to the rate-limit budget
+def page_window(pages, ahead=None):
+    if ahead is None:
+        ahead = PAGES_AHEAD or int(_limiter.bucket.burst) // 8
+    if hasattr(pages, '__len__'):
+        ahead = min(ahead, len(pages))
+    return max(1, ahead)
+
+# Yield (page, movies) in page order - stops at the first empty page
+# A window of pages (page_window) starts at once and is topped up as the caller consumes them, so five
+# pages cost about one round trip instead of five. Close the generator (contextlib.closing) to drop
+# pages that haven't started.
+def iter_pages(fetch_page, pages, ahead=None):
+    window = page_window(pages, ahead)
+    pages = iter(pages)
+    pending = deque()
+
+    def submit(count):
+        for page in itertools.islice(pages, count):
+            # Each page runs in a copy of the caller's context so it keeps the caller's rate-limit priority
+            pending.append((page, _executor.submit(contextvars.copy_context().run, fetch_page, page)))
+
+    submit(window)
+    try:
+        while pending:
+            page, future = pending.popleft()
+            movies = future.result()
+            if not movies:
+                return
+            yield page, movies
+            submit(window - len(pending))
+    finally:
+        # Pages we no longer need are dropped if they haven't started yet
+        for _, future in pending:
+            future.cancel()
+
+# Collect movies from iter_pages - fetch_page(page) returns a list of movies, keep(movie) decides which ones to collect
+# Stops at the first empty page or once `limit` movies are collected
+# Returns the collected movies and the last page that was used
+def fetch_pages(fetch_page, pages, limit=None, keep=None, ahead=None):
+    collected = []
+    last_page = None
+    with closing(iter_pages(fetch_page, pages, ahead)) as results:
+        for page, movies in results:
+            last_page = page
+            for movie in movies:
+                if keep is None or keep(movie):
+                    collected.append(movie)
+                    if limit and len(collected) >= limit:
+                        return collected, last_page
+    return collected, last_page
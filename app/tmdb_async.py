@@ -0,0 +1,211 @@
+# Asyncio TMDB client used by the async route variants (TMDB_ASYNC=1)
+# Shares the response cache, call counters and local source with app/tmdb_api.py
+import asyncio
+import atexit
+import itertools
+import os
+import threading
+import time
+from collections import deque
+import httpx
+from app.tmdb_api import (API_KEY, BASE_URL, CONNECT_TIMEOUT, READ_TIMEOUT, MAX_RETRIES, RETRY_BACKOFF,
+                          page_window, LIST_TTL, DETAILS_TTL, SEARCH_TTL, DETAILS_PARAMS, FLIGHT_LOCK_TTL,
+                          FLIGHT_POLL_INTERVAL, _cache, _cache_key, _flights, _hot_keys, _limiter, _record_call,
+                          discover_params, local_movies)
+from app.records import MovieDetails, project_movie_list, project_movie_details, movies_from_cache
+
+# Connection pool size and the most TMDB requests one client keeps in flight
+MAX_CONNECTIONS = int(os.getenv('TMDB_ASYNC_MAX_CONNECTIONS', 100))
+MAX_IN_FLIGHT = int(os.getenv('TMDB_ASYNC_MAX_IN_FLIGHT', 200))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Flask runs every async view in a fresh event loop, and httpx connections belong to the loop that opened them,
+# so the client lives on its own loop thread and requests are handed to it - connections are then
+# reused by every request the process serves
+class AsyncTMDBClient:
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="tmdb-async", daemon=True)
+        self._thread.start()
+        self._client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            transport=httpx.AsyncHTTPTransport(retries=MAX_RETRIES)
+        )
+        # Only ever used on the client's loop
+        self._semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+
+    # Run a coroutine on the client's loop and await it from the caller's loop
+    def _on_loop(self, coro):
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    # Runs on the client's loop: the request with retries on 429/5xx
+    async def _request(self, endpoint, query):
+        async with self._semaphore:
+            for attempt in range(MAX_RETRIES + 1):
+                response = await self._client.get(endpoint, params=query)
+                if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                await asyncio.sleep(float(retry_after) if retry_after.isdigit() else RETRY_BACKOFF * 2 ** attempt)
+
+    # GET - returns decoded JSON or None, like tmdb_api._get
+    # The limiter and call stats run in the caller's loop, so they see its priority and trace
+    async def _get(self, endpoint, params=None):
+        query = {"api_key": API_KEY, "language": "en-US"}
+        if params:
+            query.update(params)
+
+        if not await _limiter.acquire_async():
+            _record_call(endpoint, 0.0, False, "throttled")
+            return None
+
+        start = time.perf_counter()
+        ok = False
+        status = None
+        size = 0
+        try:
+            response = await self._on_loop(self._request(endpoint, query))
+            status = response.status_code
+            size = len(response.content)
+            if response.status_code == 200:
+                ok = True
+                return response.json()
+            return None
+        except (httpx.HTTPError, ValueError):
+            return None
+        finally:
+            _record_call(endpoint, (time.perf_counter() - start) * 1000, ok, status, size)
+
+    # Misses go through the same single-flight as tmdb_api._cached_get (so sync and async requests for a key
+    # share one fetch) and the same cross-worker lock in the shared cache tier
+    async def _cached_get(self, endpoint, params=None, ttl=LIST_TTL, project=project_movie_list):
+        key = _cache_key(endpoint, params)
+        _hot_keys.touch(key, (endpoint, params, ttl, project))
+        data = _cache.get(key)
+        if data is not None:
+            return data
+        return await _flights.do_async(key, lambda: self._fetch_once(key, endpoint, params, ttl, project))
+
+    async def _fetch_and_store(self, key, endpoint, params, ttl, project):
+        data = await self._get(endpoint, params)
+        if data is not None:
+            data = project(data)
+            _cache.set(key, data, ttl)
+            _hot_keys.stored(key, ttl)
+        return data
+
+    # tmdb_api._fetch_once with the waiting done by the event loop
+    async def _fetch_once(self, key, endpoint, params, ttl, project):
+        deadline = time.monotonic() + FLIGHT_LOCK_TTL
+        while True:
+            token = _cache.acquire_lock(key, FLIGHT_LOCK_TTL)
+            if token:
+                try:
+                    data = _cache.peek(key)
+                    if data is None:
+                        data = await self._fetch_and_store(key, endpoint, params, ttl, project)
+                    return data
+                finally:
+                    _cache.release_lock(key, token)
+
+            if time.monotonic() > deadline:
+                return await self._fetch_and_store(key, endpoint, params, ttl, project)
+
+            await asyncio.sleep(FLIGHT_POLL_INTERVAL)
+            data = _cache.peek(key)
+            if data is not None:
+                return data
+
+    async def get_popular_movies(self, page=1):
+        data = await self._cached_get("/movie/popular", {"page": page})
+        if data:
+            return movies_from_cache(data)
+        return []
+
+    async def get_movies_with_filters(self, page=1, **filters):
+        movies = local_movies(page=page, **filters)
+        if movies:
+            return movies
+
+        data = await self._cached_get("/discover/movie", discover_params(page=page, **filters))
+        if data:
+            return movies_from_cache(data[:8])
+        return []
+
+    async def get_movie_details(self, movie_id):
+        data = await self._cached_get(f"/movie/{movie_id}", DETAILS_PARAMS, ttl=DETAILS_TTL,
+                                      project=project_movie_details)
+        if data:
+            return MovieDetails.from_tuple(data)
+        return None
+
+    async def search_movies(self, query, page=1):
+        data = await self._cached_get("/search/movie", {"query": query, "page": page}, ttl=SEARCH_TTL)
+        if data:
+            return movies_from_cache(data)
+        return []
+
+    # Same contract and page window as tmdb_api.fetch_pages, with tasks instead of threads
+    async def fetch_pages(self, fetch_page, pages, limit=None, keep=None, ahead=None):
+        window = page_window(pages, ahead)
+        pages = iter(pages)
+        pending = deque()
+
+        def submit(count):
+            for page in itertools.islice(pages, count):
+                pending.append((page, asyncio.ensure_future(fetch_page(page))))
+
+        submit(window)
+        collected = []
+        last_page = None
+        try:
+            while pending:
+                page, task = pending.popleft()
+                movies = await task
+                if not movies:
+                    break
+                last_page = page
+                for movie in movies:
+                    if keep is None or keep(movie):
+                        collected.append(movie)
+                        if limit and len(collected) >= limit:
+                            return collected, last_page
+                submit(window - len(pending))
+        finally:
+            for _, task in pending:
+                task.cancel()
+        return collected, last_page
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# The process's client - rebuilt in a forked worker, like SQLiteCache._conn
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = AsyncTMDBClient()
+                _client_pid = os.getpid()
+    return _client
+
+def close_client():
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+
+atexit.register(close_client)
@@ -0,0 +1,510 @@
+# Page and API routes
+# numpy-backed modules (recommender, collab) are imported inside the routes that use them,
+# so a worker starts without them unless a preload hook already loaded them
+import json
+from datetime import datetime
+from itertools import chain
+from flask import (Blueprint, Response, render_template, request, session, redirect, jsonify, url_for, abort, send_file,
+                   stream_with_context)
+from flask_login import login_user, logout_user, login_required, current_user
+from models import db, User, Watched
+from app.tmdb_api import get_popular_movies, get_movies_with_filters, get_movie_details, search_movies, fetch_pages
+from app.search_index import CLOSE_SIMILARITY, merge_results, search_local
+from app.watched import current_watched_ids, has_watched, invalidate_watched
+from app.quiz import QUIZ_QUESTIONS, lookup_profile
+from app.quiz_store import load_quiz_state, save_quiz_state
+from app.importer import IMPORT_MODELS, MAX_IMPORT_ROWS, import_movies, read_csv
+from app.posters import GRID_SIZE, MAX_AGE, valid_poster, get_poster, poster_etag, poster_mimetype, tmdb_poster_url
+from app.fragments import cached_fragment, cached_page
+from app.instrumentation import render_metrics
+from app.feed import BATCH_SIZE as FEED_BATCH_SIZE, dump_cursor, feed_batches, load_cursor, start_cursor
+from sqlalchemy.exc import IntegrityError
+
+views = Blueprint('views', __name__)
+
+# Templates cache their user-independent parts with {% call cached_fragment(...) %}
+views.add_app_template_global(cached_fragment)
+
+# Home page - shows quiz start
+@views.route("/")
+def index():
+    return render_template("quiz_start.html")
+
+# Handle quiz questions and store answers in the quiz state
+@views.route("/quiz/<int:question_num>", methods=["GET", "POST"])
+@login_required
+def quiz(question_num=0):
+    session.permanent = True
+    
+    if request.method == "POST":
+        # Store user's answer
+        state = load_quiz_state()
+        selected = int(request.form.get("option"))
+        state.answers.append(selected)
+        save_quiz_state(state)
+        
+        # Go to next question or results
+        next_question = question_num + 1
+        if next_question < len(QUIZ_QUESTIONS):
+            return redirect(f"/quiz/{next_question}")
+        else:
+            return redirect("/results")
+    
+    # Reset answers if starting over
+    if question_num == 0 and request.method == "GET":
+        state = load_quiz_state()
+        state.answers = []
+        save_quiz_state(state)
+    
+    # Redirect if question number is invalid
+    if question_num >= len(QUIZ_QUESTIONS):
+        return redirect("/results")
+    
+    question_data = QUIZ_QUESTIONS[question_num]
+    return render_template("quiz_question.html", 
+                         question=question_data,
+                         question_num=question_num,
+                         total_questions=len(QUIZ_QUESTIONS))
+
+# Popular pages read for /movies - enough to still have 20 after filtering out watched movies
+POPULAR_PAGES = range(1, 6)
+
+def _unwatched(watched_movie_ids):
+    return lambda movie: movie['id'] not in watched_movie_ids
+
+def _render_movies(all_movies, watched_movie_ids):
+    return cached_page(render_template("movies.html", movies=all_movies[:20], watched_movie_ids=watched_movie_ids))
+
+# Show popular movies - excludes ones user has already watched
+@views.route("/movies")
+@login_required
+def movies():
+    watched_movie_ids = current_watched_ids()
+    all_movies, _ = fetch_pages(get_popular_movies, POPULAR_PAGES, limit=20, keep=_unwatched(watched_movie_ids))
+    return _render_movies(all_movies, watched_movie_ids)
+
+# Process quiz answers and show recommended movies
+@views.route("/results")
+def results():
+    state = load_quiz_state()
+    if not state.answers:
+        return redirect("/")
+    
+    # Precompiled lookup from the answers to preferences and genre weights
+    profile = lookup_profile(state.answers)
+    if profile is None:
+        return redirect("/")
+    preferences = profile.preferences._asdict()
+    preferences['genres'] = list(preferences['genres'])
+    genre_scores = dict(profile.genre_scores)
+    
+    # Save preferences and genre weights for refreshing
+    state.preferences = preferences
+    state.genre_scores = genre_scores
+    
+    # Filter out movies already watched
+    watched_movie_ids = current_watched_ids()
+
+    
+    # Rank the local catalog by weighted genre score, fall back to TMDB discover if it isn't loaded
+    from app.recommender import recommend
+    movies_data = recommend(genre_scores, preferences, exclude=watched_movie_ids)
+    page, offset = 0, len(movies_data)
+    if not movies_data:
+        movies_data = get_movies_with_filters(**preferences, page=1)
+        movies_data = [movie for movie in movies_data if movie['id'] not in watched_movie_ids]
+        page, offset = 1, None
+    
+    # Remember what is on screen so the first /refresh moves past it (and past the TMDB page it came from)
+    state.reset_shown([movie['id'] for movie in movies_data])
+    state.current_page = page
+    save_quiz_state(state)
+    
+    # Infinite scroll picks up from here through /api/recommendations (not for an unfinished quiz)
+    cursor = start_cursor(state.answers, [movie['id'] for movie in movies_data], page, offset)
+    cursor = dump_cursor(cursor) if cursor else None
+    return render_template("results.html", movies=movies_data, cursor=cursor)
+
+# The fields a results card shows - what the feed sends instead of whole movie records
+def _feed_card(movie):
+    return {
+        'id': movie['id'],
+        'title': movie['title'],
+        'overview': movie['overview'][:150],
+        'poster': poster_url(movie['poster_path']),
+        'rating': movie['vote_average']
+    }
+
+# retry: TMDB failed part way - the cursor picks up from there, but not straight away
+def _feed_batch(movies, cursor, retry=False):
+    batch = {'movies': [_feed_card(movie) for movie in movies], 'cursor': dump_cursor(cursor) if cursor else None}
+    if retry:
+        batch['retry'] = True
+    return batch
+
+def _feed_line(movies, cursor):
+    return json.dumps(_feed_batch(movies or [], cursor, movies is None), separators=(',', ':')) + '\n'
+
+# More recommendations without a page reload: /api/recommendations?cursor=... (cursor from the results page
+# or the previous response), or ?answers=0,2,1,3,0,1 / the current quiz answers to start a new feed
+# Streams NDJSON - one line per batch as soon as it is ready, each with the cursor to continue from
+# (null at the end) - or sends one JSON document when the client asks for application/json
+# 503 with the same cursor when TMDB fails before there is anything to send
+@views.route("/api/recommendations")
+def recommendations_api():
+    token = request.args.get("cursor")
+    answers = request.args.get("answers")
+    if token:
+        cursor = load_cursor(token)
+    elif answers:
+        try:
+            cursor = start_cursor([int(answer) for answer in answers.split(",")])
+        except ValueError:
+            cursor = None
+    else:
+        cursor = start_cursor(load_quiz_state().answers)
+    if cursor is None:
+        return jsonify(error="Invalid cursor or quiz answers"), 400
+    
+    limit = max(1, min(request.args.get("limit", FEED_BATCH_SIZE, type=int), 50))
+    batches = feed_batches(cursor, exclude=current_watched_ids(), limit=limit)
+    first = next(batches)
+    if first[0] is None:
+        response = jsonify(error="TMDB is unavailable, try again shortly", cursor=dump_cursor(first[1]))
+        response.headers['Retry-After'] = '5'
+        response.headers['Cache-Control'] = 'no-store'
+        return response, 503
+    batches = chain([first], batches)
+    
+    if request.accept_mimetypes.best_match(['application/x-ndjson', 'application/json']) == 'application/json':
+        movies = []
+        next_cursor = None
+        retry = False
+        for batch, next_cursor in batches:
+            if batch is None:
+                retry = True
+            else:
+                movies.extend(batch)
+        response = jsonify(_feed_batch(movies, next_cursor, retry))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    # Buffering proxies would hold the first batch back until the whole response is done
+    return Response(stream_with_context(_feed_line(batch, next_cursor) for batch, next_cursor in batches),
+                    mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+# Filter for refresh paging - skips movies already seen and remembers the ones it keeps
+def _keep_new(seen_ids):
+    def is_new(movie):
+        if movie['id'] in seen_ids:
+            return False
+        seen_ids.add(movie['id'])
+        return True
+    return is_new
+
+# Save what refresh found and render it - if nothing was new, reset and show the original results
+def _finish_refresh(state, new_movies, last_page, watched_movie_ids):
+    if not new_movies:
+        state.current_page = 1
+        movies_data = get_movies_with_filters(**state.preferences, page=1)
+        new_movies = [movie for movie in movies_data if movie['id'] not in watched_movie_ids][:8]
+        state.reset_shown([movie['id'] for movie in new_movies])
+    else:
+        state.mark_shown([movie['id'] for movie in new_movies])
+        state.current_page = last_page
+    
+    save_quiz_state(state)
+    return render_template("results.html", movies=new_movies)
+
+# Get new movie recommendations without retaking quiz
+REFRESH_PAGES = 10
+
+# Start of a refresh, shared with the async view: (state, watched ids, seen ids, local picks),
+# or None when there are no quiz results to refresh. The local engine goes first and skips everything
+# already shown; when it has nothing, the caller reads the next REFRESH_PAGES discover pages
+def _begin_refresh():
+    state = load_quiz_state()
+    if not state.preferences:
+        return None
+    
+    # Get watched movies for logged-in users
+    watched_movie_ids = current_watched_ids()
+    seen_ids = set(state.shown) | watched_movie_ids
+    from app.recommender import recommend
+    new_movies = recommend(state.genre_scores, state.preferences, exclude=seen_ids)
+    return state, watched_movie_ids, seen_ids, new_movies
+
+def _refresh_pages(state):
+    return range(state.current_page + 1, state.current_page + 1 + REFRESH_PAGES)
+
+@views.route("/refresh")
+def refresh():
+    begun = _begin_refresh()
+    if begun is None:
+        return redirect("/")
+    state, watched_movie_ids, seen_ids, new_movies = begun
+    last_page = state.current_page
+    
+    if not new_movies:
+        new_movies, last_page = fetch_pages(lambda page: get_movies_with_filters(**state.preferences, page=page),
+                                            _refresh_pages(state), limit=8, keep=_keep_new(seen_ids))
+    
+    return _finish_refresh(state, new_movies, last_page, watched_movie_ids)
+
+# Show detailed info for a movie
+@views.route("/movie/<int:movie_id>")
+def movie_details(movie_id):
+    return _render_details(movie_id, get_movie_details(movie_id))
+
+def _render_details(movie_id, movie_data):
+    if not movie_data:
+        return redirect("/")
+    
+    is_watched = has_watched(movie_id)
+    
+    # The page only differs per user when someone is logged in, so guest responses can be shared
+    html = render_template("movie_details.html", movie=movie_data, is_watched=is_watched)
+    return cached_page(html, public=not current_user.is_authenticated)
+
+# Poster URL through our proxy: {{ movie.poster_path | poster }} or {{ movie.poster_path | poster('w342') }}
+@views.app_template_filter('poster')
+def poster_url(poster_path, size=GRID_SIZE):
+    if not poster_path:
+        return ''
+    return url_for('views.poster', size=size, name=poster_path.lstrip('/'))
+
+# Serve a poster from the disk cache (send_file hands the file to the server, and answers 304s from the ETag)
+@views.route("/poster/<size>/<name>")
+def poster(size, name):
+    if not valid_poster(size, name):
+        abort(404)
+
+    path = get_poster(size, name)
+    if path is None:
+        # TMDB didn't deliver - let the browser try the CDN itself
+        return redirect(tmdb_poster_url(size, name))
+
+    try:
+        response = send_file(path, mimetype=poster_mimetype(name), conditional=True,
+                             etag=poster_etag(size, name), max_age=MAX_AGE)
+    except FileNotFoundError:
+        # Evicted (by this or another worker) between the lookup and opening it
+        return redirect(tmdb_poster_url(size, name))
+    response.headers['Cache-Control'] = f"public, max-age={MAX_AGE}, immutable"
+    return response
+
+# Mark a movie as watched
+@views.route("/mark_watched/<int:movie_id>", methods=["POST"])
+@login_required
+def mark_watched(movie_id):
+    movie_title = request.form.get("movie_title", "Unknown Movie")
+    movie_poster = request.form.get("movie_poster", "")
+    
+    # Only add if not already watched
+    if movie_id not in current_watched_ids():
+        watched_movie = Watched(user_id=current_user.id, movie_id=movie_id, movie_title=movie_title, movie_poster=movie_poster)
+        db.session.add(watched_movie)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker's cached set was stale and the row already exists
+            db.session.rollback()
+        invalidate_watched(current_user.id)
+    
+    return redirect(request.referrer or "/")
+
+# Bulk import watched movies or watchlist entries
+# JSON body: {"list": "watched", "items": [{"movie_id": 603}, {"title": "Heat", "year": 1995}]}
+# or a CSV upload in the "file" field (Letterboxd and IMDb exports work as-is)
+@views.route("/import", methods=["POST"])
+@login_required
+def import_list():
+    list_name = request.values.get("list", "watched")
+    
+    if 'file' in request.files:
+        try:
+            rows = read_csv(request.files['file'])
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            list_name = data.get("list", list_name)
+            rows = data.get("items")
+        else:
+            rows = data
+    
+    if not isinstance(list_name, str) or list_name not in IMPORT_MODELS:
+        return jsonify(error="list must be 'watched' or 'watchlist'"), 400
+    if not isinstance(rows, list) or not rows:
+        return jsonify(error="Send a JSON list of movies or a CSV file"), 400
+    if len(rows) > MAX_IMPORT_ROWS:
+        return jsonify(error=f"At most {MAX_IMPORT_ROWS} rows per import"), 400
+    
+    result = import_movies(current_user.id, rows, list_name)
+    if list_name == 'watched':
+        invalidate_watched(current_user.id)
+    return jsonify(result)
+
+# User registration
+@views.route("/register", methods=["GET", "POST"])
+def register():
+    print(f"Register route called with method: {request.method}")
+    if request.method == "POST":
+        username = request.form.get("username", "").strip()
+        email = request.form.get("email", "").strip()
+        password = request.form.get("password", "").strip()
+        
+        print(f"Attempting to register: {username}, {email}")
+
+        # Check if all fields filled
+        if not username or not email or not password:
+            print("Missing fields")
+            return render_template("register.html", error="All fields are required")
+        
+        # Check if username taken
+        if User.query.filter_by(username=username).first():
+            print("Username exists")
+            return render_template("register.html", error="Username already exists")
+        
+        # Check if email taken
+        if User.query.filter_by(email=email).first():
+            print("Email exists")
+            return render_template("register.html", error="Email already registered")
+        
+        # Create new user and log them in
+        try:
+            print("Creating user...")
+            user = User(username=username, email=email)
+            user.set_password(password)
+            db.session.add(user)
+            print("About to commit...")
+            db.session.commit()
+            
+            print(f"User created with ID: {user.id}")
+            
+            # Verify the user was actually saved
+            saved_user = User.query.filter_by(username=username).first()
+            if saved_user:
+                print(f"Verification: User {saved_user.username} found in database")
+            else:
+                print("ERROR: User not found after commit!")
+
+            login_user(user)
+            return redirect("/")
+        except Exception as e:
+            print(f"Database error: {e}")
+            db.session.rollback()
+            return render_template("register.html", error="Registration failed")
+    
+    return render_template("register.html")
+
+
+# User login
+@views.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        username = request.form.get("username")
+        password = request.form.get("password")
+
+        # Check fields provided
+        if not username or not password:
+            return render_template("login.html", error="Username and password are required")
+
+        # Find user and check password
+        user = User.query.filter_by(username=username).first()
+        
+        if user and user.check_password(password):
+            login_user(user)
+            return redirect("/")
+        else:
+            return render_template("login.html", error="Invalid username or password")
+    
+    return render_template("login.html")
+
+# Log out user
+@views.route("/logout")
+@login_required
+def logout():
+    logout_user()
+    return redirect("/")
+    
+# Show user's watched movies, newest first
+WATCHED_PAGE_SIZE = 50
+
+@views.route("/watched")
+@login_required
+def watched_list():
+    query = Watched.query.filter_by(user_id=current_user.id)
+    
+    # Keyset pagination - the cursor is the (watched_at, id) of the last movie on the previous page
+    before = request.args.get("before", "")
+    before_id = request.args.get("before_id", type=int)
+    if before and before_id:
+        try:
+            before_at = datetime.fromisoformat(before)
+            query = query.filter(db.tuple_(Watched.watched_at, Watched.id) < (before_at, before_id))
+        except ValueError:
+            pass
+    
+    watched_movies = query.order_by(Watched.watched_at.desc(), Watched.id.desc()).limit(WATCHED_PAGE_SIZE + 1).all()
+    
+    next_page = None
+    if len(watched_movies) > WATCHED_PAGE_SIZE:
+        watched_movies = watched_movies[:WATCHED_PAGE_SIZE]
+        last = watched_movies[-1]
+        next_page = {"before": last.watched_at.isoformat(), "before_id": last.id}
+    
+    return render_template("watched.html", watched_movies=watched_movies, next_page=next_page)
+
+# Search for movies
+@views.route("/search", methods=["GET", "POST"])
+def search():
+    if request.method == "POST":
+        query = request.form.get("query", "").strip()
+        if query:
+            return redirect(url_for(".search", q=query))
+    
+    query = request.args.get("q", "")
+    movies_data = []
+    if query:
+        # Close local matches on their own; otherwise TMDB's results with any looser local matches after them
+        movies_data = (search_local(query, min_similarity=CLOSE_SIMILARITY)
+                       or merge_results(search_movies(query), search_local(query)))
+    return _render_search(query, movies_data)
+
+def _render_search(query, movies_data):
+    # Filter out watched movies for logged-in users
+    if movies_data:
+        watched_movie_ids = current_watched_ids()
+        movies_data = [movie for movie in movies_data if movie['id'] not in watched_movie_ids]
+    return render_template("search.html", movies=movies_data, query=query)
+
+# Movies watched by people who watched the user's recent movies (python -m app.collab builds the data)
+@views.route("/because-you-watched")
+@login_required
+def because_watched():
+    from app.collab import because_you_watched
+    limit = max(1, min(request.args.get("limit", 20, type=int), 50))
+    return jsonify(because_you_watched(current_user.id, current_watched_ids(), limit))
+
+# Title suggestions from the local index as JSON: /autocomplete?q=matr
+@views.route("/autocomplete")
+def autocomplete():
+    query = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 10, type=int), 25))
+    suggestions = []
+    if query:
+        suggestions = [{
+            'id': movie['id'],
+            'title': movie['title'],
+            'year': movie['release_date'][:4],
+            'poster_path': movie['poster_path']
+        } for movie in search_local(query, limit)]
+    return jsonify(suggestions)
+
+# Prometheus metrics (request, TMDB, SQL and template latency histograms)
+@views.route("/metrics")
+def metrics():
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
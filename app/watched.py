@@ -0,0 +1,46 @@
+# Watched movie ids per user as a frozenset
+# Cached for the current request (flask.g) and across requests (in-process LRU with a short TTL)
+import os
+from flask import g
+from flask_login import current_user
+from models import db, Watched
+from app.cache import LRUCache
+
+# Other workers only see a new watched movie once their copy expires, so keep this short
+WATCHED_CACHE_TTL = int(os.getenv('WATCHED_CACHE_TTL', 60))
+
+_watched_cache = LRUCache(maxsize=int(os.getenv('WATCHED_CACHE_SIZE', 10000)), ttl=WATCHED_CACHE_TTL)
+
+# Load only the movie_id column for a user
+def _load_watched_ids(user_id):
+    return frozenset(movie_id for (movie_id,) in db.session.query(Watched.movie_id).filter_by(user_id=user_id))
+
+# Set of movie ids the user has watched
+def get_watched_ids(user_id):
+    per_request = g.setdefault('watched_ids', {})
+    ids = per_request.get(user_id)
+    if ids is None:
+        ids = _watched_cache.get(user_id)
+        if ids is None:
+            ids = _load_watched_ids(user_id)
+            _watched_cache.set(user_id, ids)
+        per_request[user_id] = ids
+    return ids
+
+# Watched ids for the logged-in user, or an empty set for guests
+def current_watched_ids():
+    if current_user.is_authenticated:
+        return get_watched_ids(current_user.id)
+    return frozenset()
+
+# Exact answer for one movie straight from the database (a unique index lookup) - the cached set above
+# can lag behind a change made through another worker, which a single details page would show
+def has_watched(movie_id):
+    if not current_user.is_authenticated:
+        return False
+    return db.session.query(Watched.id).filter_by(user_id=current_user.id, movie_id=movie_id).first() is not None
+
+# Call after changing a user's Watched rows
+def invalidate_watched(user_id):
+    _watched_cache.delete(user_id)
+    g.setdefault('watched_ids', {}).pop(user_id, None)
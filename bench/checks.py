@@ -0,0 +1,211 @@
+# Behaviour checks against the fake TMDB server and a throwaway SQLite database
+# Each check drives the app through Flask test clients (or calls its modules directly) and fails with
+# an AssertionError saying what it saw; the run exits 1 if any check fails
+# Run with: python -m bench.checks [check names...] [--list]
+import argparse
+import os
+from contextlib import contextmanager
+import re
+import sys
+import tempfile
+import traceback
+from bench.fake_tmdb import FakeTMDB
+from bench.seed import BENCH_PASSWORD, bench_environment, bench_username, seed
+
+# Small fixtures so a full run takes seconds
+CATALOG_SIZE = 500
+USERS = 2
+WATCHED = 50
+
+CHECKS = {}
+
+
+def check(fn):
+    CHECKS[fn.__name__] = fn
+    return fn
+
+
+# Logged-in test client for a seeded bench user
+def login(app, index=0):
+    client = app.test_client()
+    response = client.post('/login', data={'username': bench_username(index), 'password': BENCH_PASSWORD})
+    assert response.status_code == 302, f"login as {bench_username(index)} returned {response.status_code}"
+    return client
+
+# Logged-in test client for a new user with nothing watched
+def register(app, username):
+    client = app.test_client()
+    client.post('/register', data={'username': username, 'email': f'{username}@example.com', 'password': BENCH_PASSWORD})
+    response = client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+    assert response.status_code == 302, f"login as {username} returned {response.status_code}"
+    return client
+
+# Answer every quiz question with the given options (first option by default)
+def take_quiz(client, answers=None):
+    from app.quiz import QUIZ_QUESTIONS
+    answers = answers or [0] * len(QUIZ_QUESTIONS)
+    client.get('/quiz/0')
+    for question, answer in enumerate(answers):
+        client.post(f'/quiz/{question}', data={'option': answer})
+
+# Movie ids linked from a rendered results page, in order
+def movie_ids(response):
+    return [int(movie_id) for movie_id in re.findall(r'href="/movie/(\d+)"', response.get_data(as_text=True))]
+
+
+# The first /refresh must not repeat what /results just showed
+@check
+def refresh_skips_results(app, fake):
+    client = login(app)
+    take_quiz(client)
+    shown = movie_ids(client.get('/results'))
+    refreshed = movie_ids(client.get('/refresh'))
+    assert shown, "/results showed no movies"
+    assert not set(shown) & set(refreshed), f"/refresh repeated {sorted(set(shown) & set(refreshed))}"
+
+
+# Cache keys of the TMDB discover requests made inside the block (cached or not)
+@contextmanager
+def discover_reads():
+    from app import tmdb_api
+    keys = set()
+    cached_get = tmdb_api._cached_get
+
+    def recording(endpoint, params=None, *args, **kwargs):
+        if endpoint == "/discover/movie":
+            keys.add(tmdb_api._cache_key(endpoint, params))
+        return cached_get(endpoint, params, *args, **kwargs)
+
+    tmdb_api._cached_get = recording
+    try:
+        yield keys
+    finally:
+        tmdb_api._cached_get = cached_get
+
+
+# The refresher warms exactly the discover pages /results reads, one quiz per distinct profile
+@check
+def prewarm_matches_results(app, fake):
+    from app.quiz import get_profile_table, OPTION_COUNTS
+    from app.refresher import Refresher
+    from app.tmdb_api import _cache_key
+    from itertools import product
+    with app.app_context():
+        prewarmed = {_cache_key(endpoint, params) for endpoint, params, _, _ in Refresher().prewarm_requests(None)
+                     if endpoint == "/discover/movie"}
+
+    client = register(app, 'prewarm-check')
+    answers_for = {}
+    for answers, profile in zip(product(*(range(count) for count in OPTION_COUNTS)), get_profile_table()):
+        answers_for.setdefault(profile.preferences, list(answers))
+    with discover_reads() as read:
+        for answers in answers_for.values():
+            take_quiz(client, answers)
+            assert client.get('/results').status_code == 200, f"/results failed for answers {answers}"
+    assert prewarmed == read, (f"{len(prewarmed - read)} prewarmed keys /results never reads, "
+                               f"{len(read - prewarmed)} keys /results reads that are not prewarmed")
+
+
+# Answers that don't finish the quiz, or pick options it doesn't have, are a 400 rather than a feed
+@check
+def feed_rejects_bad_answers(app, fake):
+    client = login(app)
+    for answers in ('-1,-1,-1,-1,-1,-1', '0,0', '0,0,0,0,0,0,0', '9,0,0,0,0,0', 'a,b'):
+        status = client.get(f'/api/recommendations?answers={answers}').status_code
+        assert status == 400, f"answers={answers} returned {status}"
+
+
+# A TMDB failure in the feed is a 503 with a cursor to retry from, not the end of the feed
+@check
+def feed_survives_tmdb_errors(app, fake):
+    from app import tmdb_api
+    from app.feed import dump_cursor, load_cursor, start_cursor
+    from app.quiz import QUIZ_QUESTIONS
+    client = login(app)
+    with app.test_request_context():
+        token = dump_cursor(start_cursor([0] * len(QUIZ_QUESTIONS), page=1, offset=None))
+    headers = {'Accept': 'application/json'}
+
+    # Only TMDB answers, so every page has to be fetched
+    local_source = tmdb_api._local_source
+    tmdb_api.set_local_source(None)
+    tmdb_api.clear_cache()
+    try:
+        fake.error_rate = 1.0
+        try:
+            response = client.get(f'/api/recommendations?cursor={token}', headers=headers)
+        finally:
+            fake.error_rate = 0.0
+        assert response.status_code == 503, f"failing TMDB returned {response.status_code}"
+        retry = response.get_json()['cursor']
+        with app.test_request_context():
+            assert load_cursor(retry).page == 1, "the retry cursor moved past pages that failed"
+
+        response = client.get(f'/api/recommendations?cursor={retry}', headers=headers)
+        assert response.status_code == 200, f"retry returned {response.status_code}"
+        batch = response.get_json()
+        assert batch['movies'] and batch['cursor'], "retry after TMDB recovered found nothing"
+    finally:
+        tmdb_api.set_local_source(local_source)
+
+
+# A burst of identical misses on the async client makes one upstream call, like the sync path
+@check
+def async_misses_coalesce(app, fake):
+    import asyncio
+    from app.tmdb_api import clear_cache
+    from app.tmdb_async import get_client
+    clear_cache()
+    client = get_client()
+
+    async def burst():
+        return await asyncio.gather(*(client.get_movie_details(42) for _ in range(20)))
+
+    details = asyncio.run(burst())
+    assert all(movie is not None and movie['id'] == 42 for movie in details), "some requests got no details"
+    calls = fake.stats()['calls'].get('/movie/{id}', 0)
+    assert calls == 1, f"20 concurrent misses made {calls} upstream calls"
+
+
+def run(names, fake, app):
+    failed = []
+    for name in names:
+        fake.reset()
+        try:
+            CHECKS[name](app, fake)
+        except Exception:
+            failed.append(name)
+            print(f"FAIL {name}")
+            traceback.print_exc()
+        else:
+            print(f"ok   {name}")
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Behaviour checks against a fake TMDB server")
+    parser.add_argument("names", nargs="*", help="checks to run (default: all)")
+    parser.add_argument("--list", action="store_true", help="list the checks and exit")
+    options = parser.parse_args(argv)
+    if options.list:
+        print("\n".join(CHECKS))
+        return 0
+    unknown = [name for name in options.names if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+
+    fake = FakeTMDB(latency_ms=1, jitter_ms=0, catalog_size=CATALOG_SIZE).start()
+    workdir = tempfile.mkdtemp(prefix='movie_recommender_checks_')
+    bench_environment(fake.url, f"sqlite:///{os.path.join(workdir, 'checks.db')}")
+    try:
+        seed(USERS, WATCHED, CATALOG_SIZE)
+        from app.factory import create_app
+        failed = run(options.names or list(CHECKS), fake, create_app())
+    finally:
+        fake.stop()
+
+    print(f"\n{len(options.names or CHECKS) - len(failed)} passed, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# Local stand-in for the TMDB API, used by the benchmarks
+# Serves a deterministic synthetic catalog with configurable latency and error rate, and counts every call
+# Run on its own with: python -m bench.fake_tmdb [--port 8765] [--latency-ms 80] [--error-rate 0.01]
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# TMDB genre ids (the ones the quiz asks about)
+GENRES = {
+    28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy", 80: "Crime", 99: "Documentary",
+    18: "Drama", 10751: "Family", 14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music",
+    9648: "Mystery", 10749: "Romance", 878: "Science Fiction", 53: "Thriller", 10752: "War", 37: "Western"
+}
+
+TITLE_WORDS = ["Silent", "River", "Last", "Night", "Star", "Broken", "Empire", "Shadow", "Summer", "Lost",
+               "City", "Dream", "Iron", "Ghost", "Wild", "Heart", "Storm", "Secret", "Crimson", "Dawn",
+               "Ocean", "Fire", "Garden", "Hunter", "Winter", "Echo", "Kingdom", "Road", "Glass", "Moon"]
+
+PAGE_SIZE = 20
+DEFAULT_CATALOG_SIZE = 5000
+
+# Tiny JPEG-ish body for poster requests
+POSTER_BYTES = b"\xff\xd8\xff\xe0" + b"\0" * 2048 + b"\xff\xd9"
+
+
+# The same movie every time for a given id
+def synthetic_movie(movie_id):
+    rng = random.Random(movie_id)
+    words = rng.sample(TITLE_WORDS, rng.randint(1, 3))
+    year = rng.randint(1960, 2024)
+    return {
+        'id': movie_id,
+        'title': f"The {' '.join(words)}" if rng.random() < 0.3 else ' '.join(words),
+        'overview': f"A {rng.choice(['tense', 'warm', 'strange', 'bold'])} story about {' and '.join(words).lower()}. " * 3,
+        'genre_ids': rng.sample(sorted(GENRES), rng.randint(1, 3)),
+        'release_date': f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'vote_average': round(rng.uniform(3, 9), 1),
+        'vote_count': int(rng.paretovariate(1.2) * 20),
+        'popularity': round(rng.paretovariate(1.5) * 10, 3),
+        'poster_path': f"/poster{movie_id}.jpg",
+        'runtime': rng.randint(75, 190)
+    }
+
+# Details response with credits and videos appended, like append_to_response=credits,videos
+def synthetic_details(movie):
+    rng = random.Random(-movie['id'])
+    details = {key: value for key, value in movie.items() if key != 'genre_ids'}
+    details['genres'] = [{'id': genre_id, 'name': GENRES[genre_id]} for genre_id in movie['genre_ids']]
+    details['tagline'] = f"{movie['title']} - coming soon"
+    details['credits'] = {'cast': [{'id': i, 'name': f"Actor {rng.randint(1, 9999)}", 'character': f"Role {i}",
+                                    'profile_path': f"/actor{i}.jpg", 'order': i} for i in range(40)],
+                          'crew': [{'id': i, 'name': f"Crew {i}", 'job': 'Editor'} for i in range(60)]}
+    details['videos'] = {'results': [{'key': f"trailer{movie['id']}", 'name': 'Official Trailer',
+                                      'site': 'YouTube', 'type': 'Trailer'},
+                                     {'key': f"teaser{movie['id']}", 'name': 'Teaser',
+                                      'site': 'YouTube', 'type': 'Teaser'}]}
+    details['imdb_id'] = f"tt{movie['id']:07d}"
+    return details
+
+
+class FakeTMDB:
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0,
+                 catalog_size=DEFAULT_CATALOG_SIZE, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.movies = [synthetic_movie(movie_id) for movie_id in range(1, catalog_size + 1)]
+        self.by_id = {movie['id']: movie for movie in self.movies}
+        self.popular = sorted(self.movies, key=lambda movie: -movie['popularity'])
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = Counter()
+        self._errors = Counter()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    # Serve from a background thread
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # Calls per endpoint (ids collapsed to {id}) since the last reset
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self._calls), 'errors': dict(self._errors),
+                    'total': sum(self._calls.values())}
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._errors.clear()
+
+    def _delay(self):
+        with self._lock:
+            delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+        time.sleep(max(0.0, delay) / 1000)
+        return fail
+
+    # Same endpoint names as tmdb_api.get_call_stats, images under /image
+    def _count(self, path, failed):
+        if path.startswith('/t/p/'):
+            endpoint = '/image'
+        else:
+            endpoint = re.sub(r"/(tt)?\d+", "/{id}", path[len('/3'):] if path.startswith('/3/') else path)
+        with self._lock:
+            self._calls[endpoint] += 1
+            if failed:
+                self._errors[endpoint] += 1
+
+    def _page(self, movies, params):
+        page = int(params.get('page', 1))
+        start = (page - 1) * PAGE_SIZE
+        results = [{key: value for key, value in movie.items() if key != 'runtime'}
+                   for movie in movies[start:start + PAGE_SIZE]]
+        total_pages = max(1, (len(movies) + PAGE_SIZE - 1) // PAGE_SIZE)
+        return {'page': page, 'results': results, 'total_pages': total_pages, 'total_results': len(movies)}
+
+    def _discover(self, params):
+        movies = self.movies
+        if params.get('with_genres'):
+            wanted = {int(genre_id) for genre_id in re.split(r"[,|]", params['with_genres']) if genre_id}
+            movies = [movie for movie in movies if wanted & set(movie['genre_ids'])]
+        if params.get('primary_release_date.gte'):
+            movies = [movie for movie in movies if movie['release_date'] >= params['primary_release_date.gte']]
+        if params.get('primary_release_date.lte'):
+            movies = [movie for movie in movies if movie['release_date'] <= params['primary_release_date.lte']]
+        if params.get('with_runtime.gte'):
+            movies = [movie for movie in movies if movie['runtime'] >= int(params['with_runtime.gte'])]
+        if params.get('with_runtime.lte'):
+            movies = [movie for movie in movies if movie['runtime'] <= int(params['with_runtime.lte'])]
+        if params.get('vote_average.gte'):
+            movies = [movie for movie in movies if movie['vote_average'] >= float(params['vote_average.gte'])]
+
+        sort_by = params.get('sort_by', 'popularity.desc')
+        column, _, direction = sort_by.partition('.')
+        if column in ('popularity', 'vote_average', 'vote_count'):
+            movies = sorted(movies, key=lambda movie: movie[column], reverse=direction != 'asc')
+        return self._page(movies, params)
+
+    def _search(self, params):
+        query = params.get('query', '').lower()
+        movies = [movie for movie in self.popular if query and query in movie['title'].lower()]
+        return self._page(movies, params)
+
+    # Response body for an API path, or None for 404
+    def respond(self, path, params):
+        if path == '/3/movie/popular':
+            return self._page(self.popular, params)
+        if path == '/3/discover/movie':
+            return self._discover(params)
+        if path == '/3/search/movie':
+            return self._search(params)
+        match = re.fullmatch(r"/3/movie/(\d+)", path)
+        if match:
+            movie = self.by_id.get(int(match.group(1)))
+            if movie is None:
+                return None
+            if 'append_to_response' in params:
+                return synthetic_details(movie)
+            return movie
+        match = re.fullmatch(r"/3/find/tt(\d+)", path)
+        if match:
+            movie = self.by_id.get(int(match.group(1)))
+            return {'movie_results': [movie] if movie else []}
+        return None
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                failed = fake._delay()
+                fake._count(url.path, failed)
+
+                if failed:
+                    self._send(500, b'{"status_message": "fake failure"}')
+                elif url.path.startswith('/t/p/'):
+                    self._send(200, POSTER_BYTES, 'image/jpeg')
+                else:
+                    body = fake.respond(url.path, params)
+                    if body is None:
+                        self._send(404, b'{"status_message": "not found"}')
+                    else:
+                        self._send(200, json.dumps(body).encode())
+
+            def _send(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake TMDB API for benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--catalog-size", type=int, default=DEFAULT_CATALOG_SIZE)
+    args = parser.parse_args()
+
+    server = FakeTMDB(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      error_rate=args.error_rate, catalog_size=args.catalog_size)
+    print(f"Fake TMDB listening on {server.url}/3 (point TMDB_BASE_URL here, Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,300 @@
+# Benchmark / load test runner
+# Starts the fake TMDB server, points the app at it and the fixture database, then drives scripted
+# scenarios through Flask test clients from concurrent virtual users and reports per-route latency
+# Run with: python -m bench.run [--scenarios quiz details search browse] [--users 10] [--duration 20]
+#           [--seed] [--save-baseline bench/baseline.json | --baseline bench/baseline.json]
+import argparse
+import contextvars
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from bench.fake_tmdb import DEFAULT_CATALOG_SIZE, TITLE_WORDS, FakeTMDB
+from bench.seed import BENCH_PASSWORD, bench_environment, bench_username, seed
+
+# Route label of the request a thread is currently making - TMDB calls are counted against it
+_route = contextvars.ContextVar('bench_route', default=None)
+
+
+@contextmanager
+def route(label):
+    token = _route.set(label)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+# Latencies, errors and TMDB calls per route label
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.tmdb_calls = Counter()
+
+    def request(self, label, seconds, ok):
+        with self._lock:
+            self.latencies[label].append(seconds * 1000)
+            if not ok:
+                self.errors[label] += 1
+
+    # requests response hook - runs in the thread (and context) that made the TMDB call
+    def tmdb_response(self, response, *args, **kwargs):
+        label = _route.get()
+        if label is not None:
+            with self._lock:
+                self.tmdb_calls[label] += 1
+
+
+# A logged-in bench user with their own test client (cookies are per client)
+class VirtualUser:
+    def __init__(self, app, index, rng):
+        self.client = app.test_client()
+        self.recorder = None
+        self.rng = rng
+        response = self.client.post('/login', data={'username': bench_username(index), 'password': BENCH_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f"Could not log in as {bench_username(index)} - run with --seed first")
+
+    def request(self, label, path, method='GET', **kwargs):
+        with route(label):
+            start = time.perf_counter()
+            response = self.client.open(path, method=method, **kwargs)
+            elapsed = time.perf_counter() - start
+        self.recorder.request(label, elapsed, response.status_code < 500)
+        return response
+
+
+# Scenarios - each runs one iteration for a virtual user
+def quiz_scenario(user, options):
+    user.request('/quiz/<n>', '/quiz/0')
+    for question, count in enumerate(options.quiz_options):
+        user.request('/quiz/<n> POST', f'/quiz/{question}', method='POST', data={'option': user.rng.randrange(count)})
+    user.request('/results', '/results')
+    for _ in range(options.refreshes):
+        user.request('/refresh', '/refresh')
+
+# Detail page storm - most hits go to a small set of hot movies, like a trending list
+def details_scenario(user, options):
+    for _ in range(10):
+        if user.rng.random() < 0.8:
+            movie_id = user.rng.randint(1, 50)
+        else:
+            movie_id = user.rng.randint(1, options.catalog_size)
+        user.request('/movie/<id>', f'/movie/{movie_id}')
+
+def search_scenario(user, options):
+    words = user.rng.sample(TITLE_WORDS, 2)
+    query = ' '.join(words)
+    # A typo and a prefix, like someone typing into the search box
+    typo = query[:3] + query[4:]
+    user.request('/search', '/search', query_string={'q': query})
+    user.request('/search', '/search', query_string={'q': typo})
+    user.request('/autocomplete', '/autocomplete', query_string={'q': words[0][:3]})
+
+def browse_scenario(user, options):
+    user.request('/movies', '/movies')
+    user.request('/watched', '/watched')
+
+SCENARIOS = {
+    'quiz': quiz_scenario,
+    'details': details_scenario,
+    'search': search_scenario,
+    'browse': browse_scenario
+}
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+def summarize(recorder, duration, tmdb_total):
+    routes = {}
+    for label, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        routes[label] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[label],
+            'throughput': len(latencies) / duration,
+            'mean_ms': sum(latencies) / len(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'tmdb_calls': recorder.tmdb_calls[label],
+            'tmdb_per_request': recorder.tmdb_calls[label] / len(latencies)
+        }
+    requests = sum(stats['requests'] for stats in routes.values())
+    return {
+        'duration': duration,
+        'requests': requests,
+        'throughput': requests / duration if duration else 0,
+        'tmdb_calls': tmdb_total,
+        'routes': routes
+    }
+
+# Run one scenario on every virtual user's thread for options.duration seconds (or options.iterations each)
+def run_scenario(users, name, options, fake):
+    recorder = Recorder()
+    for user in users:
+        user.recorder = recorder
+    session = get_tmdb_session()
+    session.hooks['response'].append(recorder.tmdb_response)
+    fake.reset()
+
+    failures = []
+    deadline = time.monotonic() + options.duration
+
+    def worker(user):
+        iterations = 0
+        try:
+            while time.monotonic() < deadline and (not options.iterations or iterations < options.iterations):
+                SCENARIOS[name](user, options)
+                iterations += 1
+        except Exception as e:
+            failures.append(e)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    session.hooks['response'].remove(recorder.tmdb_response)
+    if failures:
+        print(f"  {len(failures)} virtual users stopped early: {failures[0]!r}")
+    return summarize(recorder, duration, fake.stats()['total'])
+
+
+def print_report(results):
+    for name, scenario in results['scenarios'].items():
+        print(f"\n{name}: {scenario['requests']} requests in {scenario['duration']:.1f}s "
+              f"({scenario['throughput']:.1f} req/s), {scenario['tmdb_calls']} TMDB calls")
+        print(f"  {'route':<20}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'tmdb/req':>10}")
+        for label, stats in scenario['routes'].items():
+            print(f"  {label:<20}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput']:>8.1f}"
+                  f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['tmdb_per_request']:>10.2f}")
+
+# Print changes against a saved run - True if anything got worse by more than max_regression percent
+def compare(results, baseline, max_regression):
+    regressed = False
+    print(f"\nCompared with baseline (regression threshold {max_regression:.0f}%):")
+    for name, scenario in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            print(f"  {name}: not in baseline")
+            continue
+        for label, stats in scenario['routes'].items():
+            old = before['routes'].get(label)
+            if old is None:
+                continue
+            changes = {
+                'p95': _change(old['p95_ms'], stats['p95_ms']),
+                'p99': _change(old['p99_ms'], stats['p99_ms']),
+                'throughput': -_change(old['throughput'], stats['throughput']),
+                'tmdb/req': _change(old['tmdb_per_request'], stats['tmdb_per_request'])
+            }
+            worse = [metric for metric, change in changes.items() if change > max_regression]
+            regressed = regressed or bool(worse)
+            print(f"  {name} {label:<20} p95 {_format(changes['p95'])}  p99 {_format(changes['p99'])}  "
+                  f"req/s {_format(-changes['throughput'])}  tmdb/req {_format(changes['tmdb/req'])}"
+                  f"{'  REGRESSED: ' + ', '.join(worse) if worse else ''}")
+    return regressed
+
+# Percentage change from old to new (0 when both are 0)
+def _change(old, new):
+    if not old:
+        return 0.0 if not new else 100.0
+    return (new - old) / old * 100
+
+def _format(change):
+    return f"{change:+.1f}%"
+
+
+def get_tmdb_session():
+    from app.tmdb_api import get_session
+    return get_session()
+
+def clear_app_caches():
+    from app.tmdb_api import clear_cache
+    from app.fragments import clear_fragments
+    clear_cache()
+    clear_fragments()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app against a fake TMDB server")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=['quiz', 'details', 'search', 'browse'])
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per scenario")
+    parser.add_argument("--iterations", type=int, default=0, help="stop each user after this many iterations")
+    parser.add_argument("--refreshes", type=int, default=3, help="/refresh calls per quiz run")
+    parser.add_argument("--latency-ms", type=float, default=80, help="fake TMDB response time")
+    parser.add_argument("--jitter-ms", type=float, default=30)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake TMDB calls that fail")
+    parser.add_argument("--catalog-size", type=int, default=DEFAULT_CATALOG_SIZE)
+    parser.add_argument("--database-url", help="defaults to BENCH_DATABASE_URL or bench/bench.db")
+    parser.add_argument("--seed", action="store_true", help="seed the fixture database first (python -m bench.seed --reset starts over)")
+    parser.add_argument("--bench-users", type=int, default=50, help="seeded users to log in as")
+    parser.add_argument("--watched", type=int, default=2000, help="watched movies per seeded user")
+    parser.add_argument("--cold", action="store_true", help="clear the app caches before each scenario")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--baseline", help="compare against a saved baseline")
+    parser.add_argument("--max-regression", type=float, default=10, help="percent; exit 1 if exceeded")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    fake = FakeTMDB(latency_ms=options.latency_ms, jitter_ms=options.jitter_ms,
+                    error_rate=options.error_rate, catalog_size=options.catalog_size).start()
+    bench_environment(fake.url, options.database_url)
+
+    results = {'config': vars(options).copy(), 'scenarios': {}}
+    try:
+        if options.seed:
+            print("Seeded:", seed(options.bench_users, options.watched, options.catalog_size))
+
+        from app.factory import create_app
+        from app.quiz import QUIZ_QUESTIONS
+        app = create_app()
+        options.quiz_options = [len(question['options']) for question in QUIZ_QUESTIONS]
+
+        # Logging in hashes a password, so users are created once and reused by every scenario
+        users = [VirtualUser(app, i % options.bench_users, random.Random(options.random_seed + i))
+                 for i in range(options.users)]
+
+        for name in options.scenarios:
+            if options.cold:
+                clear_app_caches()
+            print(f"Running {name} ({options.users} users, {options.duration:.0f}s)...")
+            results['scenarios'][name] = run_scenario(users, name, options, fake)
+    finally:
+        fake.stop()
+
+    print_report(results)
+    for path in (options.output, options.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\nWrote {path}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, options.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# Benchmark fixtures: the synthetic catalog plus users with large watched lists
+# Works against SQLite (the default bench/bench.db) or Postgres via --database-url
+# Run with: python -m bench.seed [--users 50] [--watched 2000] [--reset]
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+from bench.fake_tmdb import DEFAULT_CATALOG_SIZE, synthetic_movie
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE_URL = f"sqlite:///{os.path.join(BENCH_DIR, 'bench.db')}"
+
+BENCH_PASSWORD = "bench-password"
+BATCH_SIZE = 500
+
+
+def bench_username(i):
+    return f"bench{i}"
+
+# Point the app at the fake TMDB server and the fixture database - call before importing the app modules
+def bench_environment(tmdb_url=None, database_url=None):
+    if tmdb_url:
+        os.environ['TMDB_BASE_URL'] = f"{tmdb_url}/3"
+        os.environ['TMDB_IMAGE_BASE_URL'] = f"{tmdb_url}/t/p"
+    os.environ['DATABASE_URL'] = database_url or os.getenv('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL)
+    os.environ.setdefault('TMDB_API_KEY', 'bench')
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ.setdefault('QUIZ_PREWARM', '0')
+
+def _batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+# Fill the catalog and create users with watched_per_user random watched movies each
+def seed(users=50, watched_per_user=2000, catalog_size=DEFAULT_CATALOG_SIZE, reset=False):
+    from werkzeug.security import generate_password_hash
+    from app.factory import create_app
+    from models import db, User, Watched, CatalogMovie, CatalogSync, bulk_upsert, ensure_indexes
+    from app.catalog import movie_row, DETAIL_COLUMNS
+
+    app = create_app()
+    with app.app_context():
+        if reset:
+            db.drop_all()
+        db.create_all()
+        ensure_indexes()
+        now = datetime.utcnow()
+
+        movies = [movie_row(synthetic_movie(movie_id), now) for movie_id in range(1, catalog_size + 1)]
+        for batch in _batches(movies):
+            bulk_upsert(CatalogMovie, batch, ['id'], DETAIL_COLUMNS)
+        # The synthetic catalog is complete, so it counts as a finished sync
+        db.session.add(CatalogSync(finished_at=now, listed=len(movies), refreshed=len(movies)))
+        db.session.commit()
+
+        # Hashing is deliberately slow, so every bench user shares one hash
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        bulk_upsert(User, [{'username': bench_username(i), 'email': f"{bench_username(i)}@bench.local",
+                            'password_hash': password_hash, 'created_at': now} for i in range(users)], ['username'])
+        db.session.commit()
+
+        user_ids = [user_id for (user_id,) in db.session.query(User.id)
+                    .filter(User.username.in_([bench_username(i) for i in range(users)]))]
+        watched = 0
+        for user_id in user_ids:
+            rng = random.Random(user_id)
+            movie_ids = rng.sample(range(1, catalog_size + 1), min(watched_per_user, catalog_size))
+            rows = [{'user_id': user_id, 'movie_id': movie_id, 'movie_title': movies[movie_id - 1]['title'][:200],
+                     'movie_poster': movies[movie_id - 1]['poster_path'],
+                     'watched_at': now - timedelta(minutes=position)}
+                    for position, movie_id in enumerate(movie_ids)]
+            for batch in _batches(rows):
+                watched += bulk_upsert(Watched, batch, ['user_id', 'movie_id'])
+            db.session.commit()
+
+    return {'movies': len(movies), 'users': len(user_ids), 'watched': watched}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the benchmark database")
+    parser.add_argument("--database-url", help=f"defaults to BENCH_DATABASE_URL or {DEFAULT_DATABASE_URL}")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--watched", type=int, default=2000, help="watched movies per user")
+    parser.add_argument("--catalog-size", type=int, default=DEFAULT_CATALOG_SIZE)
+    parser.add_argument("--reset", action="store_true", help="drop all tables first")
+    args = parser.parse_args()
+
+    bench_environment(database_url=args.database_url)
+    result = seed(args.users, args.watched, args.catalog_size, args.reset)
+    print(f"Seeded {result['movies']} movies, {result['users']} users, {result['watched']} new watched rows")
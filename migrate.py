@@ -0,0 +1,12 @@
+# Bring an existing database up to date: create new tables, backfill new required columns and add any missing indexes
+# Run with: python migrate.py
+from app.factory import create_app
+from models import db, backfill_watched_at, ensure_indexes
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        backfill_watched_at()
+        ensure_indexes()
+    print("Database is up to date")
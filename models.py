@@ -1,6 +1,7 @@
 # Database models
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import func, select, text
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
@@ -38,6 +39,9 @@ class Watchlist(db.Model):
     movie_title = db.Column(db.String(200), nullable=False)
     movie_poster = db.Column(db.String(500))
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_watchlist_user_added_at', 'user_id', 'added_at'),
+                      db.Index('ux_watchlist_user_movie', 'user_id', 'movie_id', unique=True))
     
     def __repr__(self):
         return f'<Watchlist {self.movie_title}>'
@@ -49,11 +53,109 @@ class Watched(db.Model):
     movie_id = db.Column(db.Integer, nullable=False)
     movie_title = db.Column(db.String(200), nullable=False)
     movie_poster = db.Column(db.String(500))
-    watched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    watched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'movie_id'),)
+    # Second index serves the /watched page (newest first) without a sort
+    __table_args__ = (db.UniqueConstraint('user_id', 'movie_id'),
+                      db.Index('ix_watched_user_watched_at', 'user_id', 'watched_at', 'id'))
     
     def __repr__(self):
         return f'<Watched {self.movie_title}>'
-    
 
+# Local copy of TMDB movie metadata - filled by app/catalog.py
+class CatalogMovie(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # TMDB movie id
+    title = db.Column(db.String(300), nullable=False)
+    overview = db.Column(db.Text)
+    genre_ids = db.Column(db.String(200), nullable=False, default='')  # Stored as ",28,12," so one genre matches LIKE '%,28,%'
+    runtime = db.Column(db.Integer)
+    release_date = db.Column(db.String(10))
+    release_year = db.Column(db.Integer, index=True)
+    vote_average = db.Column(db.Float, nullable=False, default=0)
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+    popularity = db.Column(db.Float, nullable=False, default=0, index=True)
+    poster_path = db.Column(db.String(500))
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    details_synced_at = db.Column(db.DateTime)  # Set once runtime has been filled in from the details endpoint
+
+    def __repr__(self):
+        return f'<CatalogMovie {self.title}>'
+
+# One row per finished catalog sync - the catalog only answers discover queries once there is one
+class CatalogSync(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    finished_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    listed = db.Column(db.Integer, nullable=False, default=0)
+    refreshed = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CatalogSync {self.finished_at}>'
+
+
+# Item-item neighbours computed from co-watches (see app/collab.py)
+class MovieNeighbor(db.Model):
+    movie_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbor_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<MovieNeighbor {self.movie_id} -> {self.neighbor_id}>'
+
+
+# Server-side quiz state - the session cookie only holds the id (see app/quiz_store.py)
+class QuizSession(db.Model):
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<QuizSession {self.id}>'
+
+
+# Delete duplicate rows over columns, keeping the oldest of each, so a unique index on them can be built
+def dedupe(model, *columns):
+    keep = select(func.min(model.id)).group_by(*[getattr(model, column) for column in columns])
+    deleted = model.query.filter(model.id.notin_(keep)).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+# Give watched rows from before watched_at was required a date (the epoch, so they sort as the oldest)
+# and make the column NOT NULL - the /watched keyset pagination can't page past NULLs
+def backfill_watched_at():
+    filled = (Watched.query.filter(Watched.watched_at.is_(None))
+              .update({Watched.watched_at: datetime(1970, 1, 1)}, synchronize_session=False))
+    # SQLite can't change a column in place - there NOT NULL only applies to new databases
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(f"ALTER TABLE {Watched.__tablename__} ALTER COLUMN watched_at SET NOT NULL"))
+    db.session.commit()
+    return filled
+
+# Create indexes that are missing from an existing database (db.create_all only adds new tables)
+def ensure_indexes():
+    # Watchlist had no unique (user_id, movie_id) index at first, so older databases can hold the same movie twice
+    dedupe(Watchlist, 'user_id', 'movie_id')
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+# Insert many rows in one statement - rows that already exist are updated (or skipped if no update_columns)
+def bulk_upsert(model, rows, index_elements, update_columns=None):
+    if not rows:
+        return 0
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"bulk_upsert does not support {dialect}")
+
+    stmt = insert(model.__table__).values(rows)
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(index_elements=index_elements,
+                                          set_={column: stmt.excluded[column] for column in update_columns})
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    return db.session.execute(stmt).rowcount